@@ -0,0 +1,276 @@
+"""Benchmark ReproducibleZipFile against the standard library's zipfile.ZipFile.
+
+Each case writes one archive for a given workload, compression method, and writer
+implementation. It runs in a fresh subprocess so that peak resident memory is measured for that
+case alone. The input files are generated once from a fixed seed, so results are comparable
+across runs and branches.
+
+Usage:
+
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py --quick --workload many-small --compression deflated
+    python benchmarks/benchmark.py --repeat 5 --json results.json
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import random
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+import time
+from typing import Callable, Dict, List, Tuple
+from zipfile import ZIP_BZIP2, ZIP_DEFLATED, ZIP_LZMA, ZIP_STORED, ZipFile
+
+from repro_zipfile import ReproducibleZipFile
+
+try:
+    import resource
+except ImportError:  # pragma: no cover (Windows)
+    resource = None  # type: ignore[assignment]
+
+COMPRESSIONS = {
+    "stored": ZIP_STORED,
+    "deflated": ZIP_DEFLATED,
+    "bzip2": ZIP_BZIP2,
+    "lzma": ZIP_LZMA,
+}
+
+# Workload name -> (number of files, file size in bytes, directory depth) at full scale
+WORKLOADS = {
+    "many-small": (5000, 2 * 1024, 0),
+    "few-huge": (2, 64 * 1024 * 1024, 0),
+    "writestr": (20000, 1024, 0),
+    "deep-tree": (1000, 4 * 1024, 20),
+}
+
+QUICK_DIVISOR = 10
+
+WORDS = [
+    b"reproducible",
+    b"archive",
+    b"zip",
+    b"deterministic",
+    b"timestamp",
+    b"permission",
+    b"member",
+    b"compress",
+    b"header",
+    b"central",
+    b"directory",
+    b"entropy",
+]
+
+
+def generate_data(rng: random.Random, size: int) -> bytes:
+    """Returns moderately compressible data: random words with some random bytes mixed in."""
+    chunks: List[bytes] = []
+    total = 0
+    while total < size:
+        if rng.random() < 0.8:
+            chunk = rng.choice(WORDS) + b" "
+        else:
+            chunk = rng.getrandbits(128).to_bytes(16, "little")
+        chunks.append(chunk)
+        total += len(chunk)
+    return b"".join(chunks)[:size]
+
+
+def workload_spec(workload: str, quick: bool) -> Tuple[int, int, int]:
+    num_files, size, depth = WORKLOADS[workload]
+    if quick:
+        if num_files > QUICK_DIVISOR:
+            num_files //= QUICK_DIVISOR
+        else:
+            size //= QUICK_DIVISOR
+    return num_files, size, depth
+
+
+def generate_inputs(root: Path, workload: str, quick: bool) -> Path:
+    """Generates the input tree for a workload under root and returns its directory. The
+    writestr workload keeps its members in a single file of concatenated payloads."""
+    num_files, size, depth = workload_spec(workload, quick)
+    rng = random.Random(f"repro-zipfile-{workload}")
+    base = root / workload
+    base.mkdir()
+    if workload == "writestr":
+        (base / "payloads.bin").write_bytes(generate_data(rng, num_files * size))
+        return base
+    # Spread files across a single chain of nested directories for the deep tree
+    directories = [base]
+    for level in range(depth):
+        directories.append(directories[-1] / f"level{level:02d}")
+    directories[-1].mkdir(parents=True, exist_ok=True)
+    # Large files are built from a repeated block to keep generation fast
+    block = generate_data(rng, min(size, 1024 * 1024))
+    for i in range(num_files):
+        data = (block * (size // len(block) + 1))[:size] if size > len(block) else block
+        (directories[i % len(directories)] / f"file{i:05d}.txt").write_bytes(data)
+    return base
+
+
+def iter_tree(base: Path) -> List[Tuple[Path, str]]:
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(base):
+        dirnames.sort()
+        for name in sorted(dirnames) + sorted(filenames):
+            path = Path(dirpath, name)
+            paths.append((path, path.relative_to(base).as_posix()))
+    return paths
+
+
+def write_tree(zip_class: type) -> Callable[[Path, Path, int], None]:
+    def run(base: Path, out: Path, compression: int) -> None:
+        with zip_class(out, "w", compression=compression) as zp:
+            for path, arcname in iter_tree(base):
+                zp.write(path, arcname=arcname)
+
+    return run
+
+
+def write_many_tree(base: Path, out: Path, compression: int) -> None:
+    with ReproducibleZipFile(out, "w", compression=compression) as zp:
+        zp.write_many(iter_tree(base))
+
+
+def writestr_members(base: Path) -> List[Tuple[str, bytes]]:
+    # Quick mode only reduces the number of members, so their size is always the full-scale one
+    _, size, _ = WORKLOADS["writestr"]
+    payloads = (base / "payloads.bin").read_bytes()
+    return [
+        (f"member{i:05d}.txt", payloads[i * size : (i + 1) * size])
+        for i in range(len(payloads) // size)
+    ]
+
+
+def writestr_loop(zip_class: type) -> Callable[[Path, Path, int], None]:
+    def run(base: Path, out: Path, compression: int) -> None:
+        members = writestr_members(base)
+        with zip_class(out, "w", compression=compression) as zp:
+            for arcname, data in members:
+                zp.writestr(arcname, data)
+
+    return run
+
+
+def writestr_many(base: Path, out: Path, compression: int) -> None:
+    members = writestr_members(base)
+    with ReproducibleZipFile(out, "w", compression=compression) as zp:
+        zp.writestr_many(members)
+
+
+# Workload kind -> implementation name -> writer. The first implementation is the baseline.
+IMPLEMENTATIONS: Dict[str, Dict[str, Callable[[Path, Path, int], None]]] = {
+    "files": {
+        "zipfile": write_tree(ZipFile),
+        "repro": write_tree(ReproducibleZipFile),
+        "repro-write_many": write_many_tree,
+    },
+    "writestr": {
+        "zipfile": writestr_loop(ZipFile),
+        "repro": writestr_loop(ReproducibleZipFile),
+        "repro-writestr_many": writestr_many,
+    },
+}
+
+
+def implementations_for(workload: str) -> Dict[str, Callable[[Path, Path, int], None]]:
+    return IMPLEMENTATIONS["writestr" if workload == "writestr" else "files"]
+
+
+def peak_rss_mib() -> float:
+    if resource is None:
+        return float("nan")
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kibibytes elsewhere
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_case(workload: str, implementation: str, compression: str, base: Path, out: Path) -> None:
+    """Child process entrypoint: runs one case and prints its measurements as JSON."""
+    writer = implementations_for(workload)[implementation]
+    start = time.perf_counter()
+    writer(base, out, COMPRESSIONS[compression])
+    elapsed = time.perf_counter() - start
+    result = {"seconds": elapsed, "peak_rss_mib": peak_rss_mib(), "size": out.stat().st_size}
+    print(json.dumps(result))
+
+
+def measure(
+    workload: str, implementation: str, compression: str, base: Path, out: Path
+) -> Dict[str, float]:
+    cmd = [sys.executable, __file__, "--child", workload, implementation, compression]
+    proc = subprocess.run([*cmd, str(base), str(out)], check=True, capture_output=True, text=True)
+    out.unlink()
+    return json.loads(proc.stdout)
+
+
+def input_size(base: Path) -> int:
+    return sum(path.stat().st_size for path, _ in iter_tree(base) if path.is_file())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workload", choices=list(WORKLOADS), action="append")
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), action="append")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best is kept.")
+    parser.add_argument("--quick", action="store_true", help="Use 1/10 size workloads.")
+    parser.add_argument("--json", type=Path, help="Also write results to this JSON file.")
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        workload, implementation, compression, base, out = args.child
+        run_case(workload, implementation, compression, Path(base), Path(out))
+        return
+
+    workloads = args.workload or list(WORKLOADS)
+    compressions = args.compression or list(COMPRESSIONS)
+    results = []
+    header = (
+        f"{'workload':<12} {'compression':<11} {'implementation':<20} "
+        f"{'seconds':>8} {'MiB/s':>8} {'peak MiB':>9} {'vs zipfile':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    with TemporaryDirectory() as tmpdir:
+        tmp_path = Path(tmpdir)
+        for workload in workloads:
+            base = generate_inputs(tmp_path, workload, args.quick)
+            size_mib = input_size(base) / (1024 * 1024)
+            for compression in compressions:
+                baseline = None
+                for implementation in implementations_for(workload):
+                    runs = [
+                        measure(workload, implementation, compression, base, tmp_path / "out.zip")
+                        for _ in range(args.repeat)
+                    ]
+                    best = min(runs, key=lambda run: run["seconds"])
+                    seconds = best["seconds"]
+                    if baseline is None:
+                        baseline = seconds
+                    result = {
+                        "workload": workload,
+                        "compression": compression,
+                        "implementation": implementation,
+                        "seconds": seconds,
+                        "throughput_mib_s": size_mib / seconds,
+                        "peak_rss_mib": max(run["peak_rss_mib"] for run in runs),
+                        "archive_size": best["size"],
+                        "relative_to_zipfile": seconds / baseline,
+                    }
+                    results.append(result)
+                    print(
+                        f"{workload:<12} {compression:<11} {implementation:<20} "
+                        f"{seconds:>8.3f} {result['throughput_mib_s']:>8.1f} "
+                        f"{result['peak_rss_mib']:>9.1f} {result['relative_to_zipfile']:>9.2f}x"
+                    )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,25 @@
+import heapq
 from importlib.metadata import version
+import itertools
 import logging
+import os
 from pathlib import Path
+import re
+import stat
 import sys
-from typing import List, Optional
+import time
+from typing import (
+    BinaryIO,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 if sys.version_info >= (3, 9):
     from typing import Annotated
@@ -11,7 +28,14 @@ else:
 
 import typer
 
-from repro_zipfile import ReproducibleZipFile
+from repro_zipfile import (
+    MemberStats,
+    ReproducibleZipFile,
+    WriteStats,
+    normalize,
+    update,
+    verify,
+)
 
 __version__ = version("rpzip")
 
@@ -29,16 +53,459 @@ def version_callback(value: bool):
         raise typer.Exit()
 
 
+InputPath = Union[Path, "os.DirEntry[str]"]
+
+# Minimum number of seconds between progress reports
+_PROGRESS_INTERVAL = 1.0
+
+
+def _log_adding(paths: Iterable[InputPath], level: int = logging.INFO) -> Iterator[InputPath]:
+    """Log each path at the given level as it is consumed for writing to the archive."""
+    if not logger.isEnabledFor(level):
+        # Skip the overhead of a logging call per path
+        yield from paths
+        return
+    for path in paths:
+        logger.log(level, "adding: %s", os.fspath(path))
+        yield path
+
+
+def _input_size(path: InputPath) -> int:
+    """Return the number of bytes of data that path adds to the archive: its size if it's a
+    regular file, and 0 otherwise. DirEntry objects cache the stat result for writing later."""
+    try:
+        st = path.stat()
+    except OSError:
+        return 0
+    return st.st_size if stat.S_ISREG(st.st_mode) else 0
+
+
+def _format_bytes(n: float) -> str:
+    """Format a number of bytes using binary prefixes, e.g., '1.5 MiB'."""
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(n) < 1024 or unit == "TiB":
+            break
+        n /= 1024
+    return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+
+
+def _format_duration(seconds: float) -> str:
+    """Format a number of seconds like '1h02m03s', '2m05s', or '7s'."""
+    minutes, secs = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{secs:02d}s"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
+
+
+class _Progress:
+    """Reports the progress of writing total_files files with total_bytes bytes of data to
+    stream, with throughput and the estimated time remaining, at most once every interval
+    seconds. Call it with the MemberStats of each member once it's written. On a terminal, the
+    report is updated in place."""
+
+    def __init__(
+        self,
+        total_files: int,
+        total_bytes: int,
+        interval: float = _PROGRESS_INTERVAL,
+        stream: Optional[TextIO] = None,
+    ):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.files = 0
+        self.bytes = 0
+        self._start = self._last = time.monotonic()
+        self._in_place = self.stream.isatty()
+        self._width = 0
+
+    def __call__(self, member: MemberStats):
+        self.files += 1
+        self.bytes += member.file_size
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._report(now)
+
+    def finish(self):
+        """Report the final progress."""
+        self._report(time.monotonic())
+        if self._in_place:
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def _report(self, now: float):
+        elapsed = max(now - self._start, 1e-9)
+        bytes_rate = self.bytes / elapsed
+        files_rate = self.files / elapsed
+        if self.total_bytes and bytes_rate:
+            remaining = (self.total_bytes - self.bytes) / bytes_rate
+        elif files_rate:
+            remaining = (self.total_files - self.files) / files_rate
+        else:
+            remaining = 0.0
+        percent = self.bytes / self.total_bytes if self.total_bytes else 1.0
+        line = (
+            f"{self.files}/{self.total_files} files, {_format_bytes(self.bytes)}/"
+            f"{_format_bytes(self.total_bytes)} ({percent:.1%}), "
+            f"{_format_bytes(bytes_rate)}/s, {files_rate:.0f} files/s, "
+            f"ETA {_format_duration(max(remaining, 0.0))}"
+        )
+        if self._in_place:
+            self.stream.write("\r" + line.ljust(self._width))
+            self._width = len(line)
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+
+class _TimedInputs:
+    """Iterator over the items of inputs that records the total time spent producing them, e.g.,
+    walking directories, in seconds."""
+
+    def __init__(self, inputs: Iterable[InputPath]):
+        self._inputs = iter(inputs)
+        self.seconds = 0.0
+
+    def __iter__(self) -> "_TimedInputs":
+        return self
+
+    def __next__(self) -> InputPath:
+        start = time.perf_counter()
+        try:
+            return next(self._inputs)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+class _SlowestMembers:
+    """Keeps the MemberStats of the n members that took the longest to write."""
+
+    def __init__(self, n: int = 10):
+        self.n = n
+        self._heap: List[Tuple[float, int, MemberStats]] = []
+        # Tiebreaker so that MemberStats are never compared
+        self._counter = itertools.count()
+
+    def __call__(self, member: MemberStats):
+        total = member.stat_time + member.read_time + member.compress_time + member.write_time
+        item = (total, next(self._counter), member)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif total > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def members(self) -> List[Tuple[float, MemberStats]]:
+        """Return (total seconds, MemberStats) pairs, slowest first."""
+        return [(total, member) for total, _, member in sorted(self._heap, reverse=True)]
+
+
+def _print_stats(
+    stats: WriteStats, slowest: _SlowestMembers, walk_seconds: float, wall_seconds: float
+):
+    """Print a report of where time was spent writing the archive to stderr."""
+    lines = [
+        f"wall time: {wall_seconds:.3f}s",
+        f"walk time: {walk_seconds:.3f}s",
+        stats.summary(),
+        "slowest members:",
+    ]
+    for total, member in slowest.members():
+        lines.append(
+            f"  {total:.3f}s {member.filename} (stat {member.stat_time:.3f}s, "
+            f"read {member.read_time:.3f}s, compress {member.compress_time:.3f}s, "
+            f"write {member.write_time:.3f}s, ratio {member.ratio:.3f})"
+        )
+    typer.echo("\n".join(lines), err=True)
+
+
+def _translate_pattern(pattern: str) -> str:
+    """Translate a gitignore-style glob pattern into a regular expression. '*' and '?' don't
+    match '/', while '**' matches any number of directories."""
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[" and pattern.find("]", i + 2) != -1:
+            j = pattern.find("]", i + 2)
+            body = pattern[i + 1 : j].replace("\\", "\\\\")
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = j + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+class _PathFilter:
+    """Decides which paths are added to the archive from gitignore-style exclude and include
+    patterns. A pattern without a '/' (other than a trailing one) matches the name of a file or
+    directory at any depth. Otherwise, it matches the whole path: relative to the input
+    directory for paths found by walking it, or as given for input paths. A trailing '/' matches
+    only directories. For exclude patterns, the last matching pattern wins, and a leading '!'
+    re-includes paths matched by earlier patterns. If there are include patterns, only paths
+    matching one of them are added, but directories are still walked."""
+
+    def __init__(self, exclude: Iterable[str] = (), include: Iterable[str] = ()) -> None:
+        self.exclude = [self._compile(pattern) for pattern in exclude]
+        self.include = [self._compile(pattern) for pattern in include]
+
+    def __bool__(self) -> bool:
+        return bool(self.exclude or self.include)
+
+    @staticmethod
+    def _compile(pattern: str) -> Tuple[Pattern[str], bool, bool, bool]:
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        regex = re.compile(_translate_pattern(pattern.lstrip("/")) + r"\Z", re.DOTALL)
+        return regex, negate, dir_only, anchored
+
+    @staticmethod
+    def _matches(rule: Tuple[Pattern[str], bool, bool, bool], rel: str, is_dir: bool) -> bool:
+        regex, _, dir_only, anchored = rule
+        if dir_only and not is_dir:
+            return False
+        return regex.match(rel if anchored else rel.rpartition("/")[2]) is not None
+
+    def excluded(self, rel: str, is_dir: bool) -> bool:
+        """Whether the path rel is excluded. Excluded directories are not walked."""
+        excluded = False
+        for rule in self.exclude:
+            if rule[1] == excluded and self._matches(rule, rel, is_dir):
+                excluded = not excluded
+        return excluded
+
+    def included(self, rel: str, is_dir: bool) -> bool:
+        """Whether the path rel, if not excluded, is added to the archive."""
+        return not self.include or any(self._matches(rule, rel, is_dir) for rule in self.include)
+
+
+def _read_patterns(path: Path) -> List[str]:
+    """Read gitignore-style patterns from a file, skipping blank lines and comments."""
+    patterns = []
+    for line in path.read_text().splitlines():
+        line = line.rstrip()
+        if line and not line.startswith("#"):
+            patterns.append(line)
+    return patterns
+
+
+def _scandir_sorted(path: str) -> List["os.DirEntry[str]"]:
+    """List the entries of a directory, sorted by name. Directories that can't be read are
+    treated as empty."""
+    try:
+        with os.scandir(path) as it:
+            return sorted(it, key=lambda entry: os.path.normcase(entry.name))
+    except PermissionError:
+        logger.warning("skipping unreadable directory: %s", path)
+        return []
+
+
+def _walk(
+    root: Path, root_key: Tuple[str, ...], path_filter: _PathFilter
+) -> Iterator[Tuple[Tuple[str, ...], "os.DirEntry[str]"]]:
+    """Yield the entries under directory root depth-first, sorted by name within each directory,
+    without following symlinks to directories. Each entry is paired with a sort key of its path
+    components, so that the order is the same as sorting the paths. Only the entries of the
+    directories currently being walked are held in memory. Excluded directories are skipped
+    without being walked."""
+    stack = [(root_key, "", iter(_scandir_sorted(str(root))))]
+    while stack:
+        parent_key, parent_rel, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        key = parent_key + (os.path.normcase(entry.name),)
+        rel = f"{parent_rel}/{entry.name}" if parent_rel else entry.name
+        if path_filter:
+            is_dir = entry.is_dir()
+            if path_filter.excluded(rel, is_dir):
+                continue
+            if path_filter.included(rel, is_dir):
+                yield key, entry
+        else:
+            yield key, entry
+        if entry.is_dir(follow_symlinks=False):
+            stack.append((key, rel, iter(_scandir_sorted(entry.path))))
+
+
+def _iter_inputs(
+    in_list: Iterable[str], recurse_paths: bool, path_filter: Optional[_PathFilter] = None
+) -> Iterator[InputPath]:
+    """Yield the input paths in sorted order, each only once. With recurse_paths, directories are
+    walked with os.scandir, and entries are yielded as they are found with their stat results
+    for reuse by ReproducibleZipFile.write_many. Paths are filtered by path_filter."""
+    if path_filter is None:
+        path_filter = _PathFilter()
+    in_paths = sorted(set(Path(p) for p in in_list))
+    streams: List[Iterator[Tuple[Tuple[str, ...], InputPath]]] = []
+    for path in in_paths:
+        rel = path.as_posix()
+        is_dir = path.is_dir()
+        if path_filter.excluded(rel, is_dir):
+            continue
+        key = tuple(os.path.normcase(part) for part in path.parts)
+        if path_filter.included(rel, is_dir):
+            streams.append(iter([(key, path)]))
+        if recurse_paths and is_dir:
+            streams.append(_walk(path, key, path_filter))
+    # Inputs can be nested inside other input directories, so merge the sorted streams
+    last_key = None
+    for key, item in heapq.merge(*streams, key=lambda item: item[0]):
+        if key != last_key:
+            yield item
+            last_key = key
+
+
 @app.command(context_settings={"obj": {}})
 def rpzip(
     out_file: Annotated[
         str,
-        typer.Argument(help="Path of output archive. '.zip' suffix will be added if not present."),
+        typer.Argument(
+            help=(
+                "Path of output archive. '.zip' suffix will be added if not present. Use '-' to "
+                "write to stdout."
+            )
+        ),
     ],
     in_list: Annotated[List[str], typer.Argument(help="Files to add to the archive.")],
     recurse_paths: Annotated[
         bool, typer.Option("--recurse-paths", "-r", help="Recurse into directories.")
     ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            min=1,
+            help="Number of worker threads used to read and compress files.",
+        ),
+    ] = 1,
+    exclude: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            "--exclude",
+            "-x",
+            help=(
+                "Exclude paths matching a gitignore-style pattern. Excluded directories are "
+                "not walked. Can be used multiple times."
+            ),
+        ),
+    ] = None,
+    include: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            "--include",
+            "-i",
+            help=(
+                "Only add paths matching a gitignore-style pattern. Can be used multiple times."
+            ),
+        ),
+    ] = None,
+    exclude_from: Annotated[
+        Optional[List[Path]],
+        typer.Option(
+            "--exclude-from",
+            exists=True,
+            dir_okay=False,
+            help="Exclude paths matching patterns read from a file, like a .gitignore file.",
+        ),
+    ] = None,
+    update_archive: Annotated[
+        bool,
+        typer.Option(
+            "--update",
+            help=(
+                "If the output archive exists, reuse compressed data of files that haven't "
+                "changed. Reused members keep the compression of the existing archive."
+            ),
+        ),
+    ] = False,
+    streaming: Annotated[
+        bool,
+        typer.Option(
+            "--streaming",
+            help=(
+                "Write the archive the same way as when streaming to stdout, so that the output "
+                "is identical. Always on when writing to stdout."
+            ),
+        ),
+    ] = False,
+    show_stats: Annotated[
+        bool,
+        typer.Option(
+            "--stats",
+            help=(
+                "Print the time spent walking directories and getting file metadata, reading, "
+                "compressing, and writing members, and the slowest members, to stderr. Times "
+                "are summed over worker threads."
+            ),
+        ),
+    ] = False,
+    progress: Annotated[
+        bool,
+        typer.Option(
+            "--progress",
+            help=(
+                "Report progress to stderr with throughput and the estimated time remaining, "
+                "instead of logging each file. All directories are walked before writing starts "
+                "to find the total size."
+            ),
+        ),
+    ] = False,
+    normalize_archive: Annotated[
+        bool,
+        typer.Option(
+            "--normalize",
+            help=(
+                "Write a reproducible copy of the archive given as the only input to OUT_FILE, "
+                "copying compressed data as-is and normalizing metadata and member order."
+            ),
+        ),
+    ] = False,
+    diff: Annotated[
+        bool,
+        typer.Option(
+            "--diff",
+            help=(
+                "Compare the archive OUT_FILE with the archive given as the only input instead "
+                "of writing, and print the members and fields that differ. Compares the central "
+                "directories, without extracting. Exits with status 1 if the archives differ."
+            ),
+        ),
+    ] = False,
+    deep: Annotated[
+        bool,
+        typer.Option(
+            "--deep",
+            help="With --diff, also compare the compressed data of members byte for byte.",
+        ),
+    ] = False,
     quiet: Annotated[
         int,
         typer.Option(
@@ -78,6 +545,10 @@ def rpzip(
       rpzip archive.zip file1.txt file2.txt  # Archive two files
       rpzip archive.zip some_dir/*.txt       # Archive with glob
       rpzip -r archive.zip some_dir/         # Archive directory recursively
+      rpzip -r archive.zip some_dir/ -x .git # Archive directory, excluding .git
+      rpzip -r - some_dir/ | some_command    # Stream archive to stdout
+      rpzip --diff archive.zip other.zip     # Compare two archives
+      rpzip --normalize out.zip vendor.zip   # Make an existing archive reproducible
     """
     # Set up logger
     log_level = logging.INFO + 10 * quiet - 10 * verbose
@@ -91,25 +562,101 @@ def rpzip(
     logger.debug("out_file: %s", out_file)
     logger.debug("in_list: %s", in_list)
     logger.debug("recurse_paths: %s", recurse_paths)
+    logger.debug("exclude: %s", exclude)
+    logger.debug("include: %s", include)
+    logger.debug("exclude_from: %s", exclude_from)
+    logger.debug("jobs: %s", jobs)
+    logger.debug("update_archive: %s", update_archive)
+    logger.debug("streaming: %s", streaming)
+    logger.debug("show_stats: %s", show_stats)
+    logger.debug("progress: %s", progress)
+    logger.debug("normalize_archive: %s", normalize_archive)
+    logger.debug("diff: %s", diff)
+    logger.debug("deep: %s", deep)
+
+    if diff:
+        if len(in_list) != 1:
+            raise typer.BadParameter(
+                "requires exactly one input archive to compare with", param_hint="--diff"
+            )
+        differences = verify(out_file, in_list[0], deep=deep)
+        for difference in differences:
+            typer.echo(str(difference))
+        if differences:
+            raise typer.Exit(1)
+        logger.info("no differences found")
+        return
 
     # Set output archive path
-    out_path = Path(out_file)
-    if not out_path.suffix:
-        out_path = out_path.with_suffix(".zip")
-    out_path = out_path.resolve()
-    logger.debug("writing to: %s", out_path)
-
-    # Process inputs
-    in_paths = set(Path(p) for p in in_list)
-    if recurse_paths:
-        for path in frozenset(in_paths):
-            if path.is_dir():
-                in_paths.update(path.glob("**/*"))
-
-    with ReproducibleZipFile(out_path, "w") as zp:
-        for path in sorted(in_paths):
-            logger.info("adding: %s", path)
-            zp.write(path)
+    if out_file == "-":
+        if update_archive:
+            raise typer.BadParameter("can't be used when writing to stdout", param_hint="--update")
+        # Use the same layout for stdout whether it's a pipe or redirected to a file
+        out: Union[Path, BinaryIO] = sys.stdout.buffer
+        streaming = True
+        logger.debug("writing to: stdout")
+    else:
+        out = Path(out_file)
+        if not out.suffix:
+            out = out.with_suffix(".zip")
+        out = out.resolve()
+        logger.debug("writing to: %s", out)
+
+    if normalize_archive:
+        if len(in_list) != 1:
+            raise typer.BadParameter(
+                "requires exactly one input archive to normalize", param_hint="--normalize"
+            )
+        if update_archive:
+            raise typer.BadParameter("can't be used with --normalize", param_hint="--update")
+        logger.info("normalizing: %s", in_list[0])
+        normalize(in_list[0], out, streaming=streaming)
+        if out is sys.stdout.buffer:
+            out.flush()
+        return
+
+    # Set up filters, with patterns from files first so that they can be overridden by -x
+    exclude_patterns: List[str] = []
+    for patterns_path in exclude_from or []:
+        exclude_patterns.extend(_read_patterns(patterns_path))
+    exclude_patterns.extend(exclude or [])
+    path_filter = _PathFilter(exclude_patterns, include or [])
+
+    # Set up instrumentation
+    start = time.perf_counter()
+    inputs = _TimedInputs(_iter_inputs(in_list, recurse_paths, path_filter))
+    callbacks: List[Callable[[MemberStats], None]] = []
+    slowest = _SlowestMembers()
+    if show_stats:
+        callbacks.append(slowest)
+    in_paths: Iterable[InputPath] = inputs
+    report = None
+    if progress:
+        # Walk everything first to find the totals for the estimated time remaining
+        in_paths = list(inputs)
+        report = _Progress(len(in_paths), sum(_input_size(path) for path in in_paths))
+        callbacks.append(report)
+
+    def on_member(member: MemberStats):
+        for callback in callbacks:
+            callback(member)
+
+    stats = WriteStats(on_member=on_member) if callbacks else None
+
+    # Process inputs, streaming them into the archive as directories are walked
+    in_paths = _log_adding(in_paths, logging.DEBUG if progress else logging.INFO)
+    if update_archive:
+        update(out, in_paths, workers=jobs, streaming=streaming, stats=stats)
+    else:
+        with ReproducibleZipFile(out, "w", streaming=streaming, stats=stats) as zp:
+            zp.write_many(in_paths, workers=jobs)
+        if out is sys.stdout.buffer:
+            out.flush()
+
+    if report is not None:
+        report.finish()
+    if show_stats and stats is not None:
+        _print_stats(stats, slowest, inputs.seconds, time.perf_counter() - start)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,158 @@
+import asyncio
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
+from fnmatch import fnmatchcase
+from functools import partial
+import hashlib
 from importlib.metadata import version
+import io
+from itertools import chain
+import math
+import mmap
 import os
 import shutil
-import sys
+import stat
+import struct
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile, TemporaryFile
+import threading
 import time
 from typing import Tuple
-from zipfile import ZIP_LZMA, ZipFile, ZipInfo
+from zipfile import (  # type: ignore[attr-defined]
+    _DD_SIGNATURE,
+    _FH_EXTRA_FIELD_LENGTH,
+    _FH_FILENAME_LENGTH,
+    _FH_SIGNATURE,
+    ZIP64_LIMIT,
+    ZIP_LZMA,
+    ZIP_STORED,
+    BadZipFile,
+    LargeZipFile,
+    ZipFile,
+    ZipInfo,
+    _get_compressor,
+    sizeCentralDir,
+    sizeEndCentDir,
+    sizeEndCentDir64,
+    sizeEndCentDir64Locator,
+    sizeFileHeader,
+    stringFileHeader,
+    structFileHeader,
+)
+from zlib import ZLIB_RUNTIME_VERSION, crc32
 
 try:
-    from zipfile import _MASK_COMPRESS_OPTION_1  # type: ignore[attr-defined]
+    from zipfile import ZIP_ZSTANDARD  # type: ignore[attr-defined]
+except ImportError:
+    ZIP_ZSTANDARD = 93
+
+# Zstandard is in the standard library from Python 3.14, and otherwise available from the
+# optional backports.zstd package, which has the same API
+try:
+    from compression import zstd as _zstd  # type: ignore[import-not-found]
+except ImportError:
+    try:
+        from backports import zstd as _zstd  # type: ignore[import-not-found,no-redef]
+    except ImportError:
+        _zstd = None
+
+try:
+    from zipfile import (  # type: ignore[attr-defined]
+        _MASK_COMPRESS_OPTION_1,
+        _MASK_ENCRYPTED,
+        _MASK_USE_DATA_DESCRIPTOR,
+    )
 except ImportError:
     _MASK_COMPRESS_OPTION_1 = 0x02
+    _MASK_ENCRYPTED = 0x01
+    _MASK_USE_DATA_DESCRIPTOR = 0x08
 
-__all__ = ["date_time", "file_mode", "dir_mode", "ReproducibleZipFile"]
+__all__ = [
+    "date_time",
+    "file_mode",
+    "dir_mode",
+    "update",
+    "normalize",
+    "verify",
+    "Difference",
+    "CompressionCache",
+    "CompressionPolicy",
+    "MemberStats",
+    "WriteStats",
+    "ReproducibleZipFile",
+    "AsyncReproducibleZipFile",
+    "SplitReproducibleZipFile",
+    "ZIP_ZSTANDARD",
+]
 
 __version__ = version("repro-zipfile")
 
+# Default size of chunks read from source files
+_CHUNK_SIZE = 1024 * 1024
+# Upper bound on the bytes of an archive's end of central directory records, including ZIP64
+_PART_OVERHEAD = sizeEndCentDir + sizeEndCentDir64 + sizeEndCentDir64Locator
+# Version needed to extract Zstandard-compressed members, per the ZIP specification
+_ZSTANDARD_VERSION = 63
+# Compressed data for a member is held in memory up to this size before spilling to disk
+_SPOOL_MAX_SIZE = 1024 * 1024 * 4
+# Types of file objects that write data to their file descriptor unchanged, so data can be
+# copied to it within the kernel
+_ZERO_COPY_TYPES = (io.FileIO, io.BufferedWriter, io.BufferedRandom)
+# ZipInfo attributes compared by verify, in the order of the central directory entry
+_VERIFY_FIELDS = (
+    "create_version",
+    "create_system",
+    "extract_version",
+    "flag_bits",
+    "compress_type",
+    "date_time",
+    "CRC",
+    "compress_size",
+    "file_size",
+    "extra",
+    "comment",
+    "volume",
+    "internal_attr",
+    "external_attr",
+)
+# Samples shorter than this are too small for their entropy to say much about compressibility
+_MIN_SAMPLE_SIZE = 1024
+# File name patterns of formats whose data is already compressed
+_COMPRESSED_PATTERNS = (
+    "*.7z",
+    "*.avif",
+    "*.br",
+    "*.bz2",
+    "*.docx",
+    "*.flac",
+    "*.gif",
+    "*.gz",
+    "*.heic",
+    "*.jar",
+    "*.jpeg",
+    "*.jpg",
+    "*.lz4",
+    "*.lzma",
+    "*.m4a",
+    "*.mkv",
+    "*.mov",
+    "*.mp3",
+    "*.mp4",
+    "*.ogg",
+    "*.parquet",
+    "*.png",
+    "*.pptx",
+    "*.rar",
+    "*.tgz",
+    "*.webm",
+    "*.webp",
+    "*.whl",
+    "*.xlsx",
+    "*.xz",
+    "*.zip",
+    "*.zst",
+)
+
 
 def date_time() -> Tuple[int, int, int, int, int, int]:
     """Returns date_time value used to force overwrite on all ZipInfo objects. Defaults to
@@ -52,6 +189,652 @@ def dir_mode() -> int:
     return 0o755
 
 
+def _resolve_metadata(fixed_date_time=None, fixed_file_mode=None, fixed_dir_mode=None):
+    """Returns the date_time value and the external_attr values for files and directories to
+    force overwrite on all ZipInfo objects. Any of the values that are None are set from the
+    defaults of date_time, file_mode, and dir_mode."""
+    if fixed_date_time is None:
+        fixed_date_time = date_time()
+    if fixed_file_mode is None:
+        fixed_file_mode = file_mode()
+    if fixed_dir_mode is None:
+        fixed_dir_mode = dir_mode()
+    file_attr = fixed_file_mode << 16
+    dir_attr = (0o40000 | fixed_dir_mode) << 16
+    dir_attr |= 0x10  # MS-DOS directory flag
+    return tuple(fixed_date_time), file_attr, dir_attr
+
+
+# Following function modified from Python 3.11 ZipInfo.from_file
+# https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py
+# Copyright Python Software Foundation, licensed under PSF License Version 2
+# See LICENSE file for full license agreement and notice of copyright
+def _arcname(filename, arcname, isdir=False):
+    """Return the name in the archive of a file on the filesystem, as ZipInfo.from_file does."""
+    if isinstance(filename, os.PathLike):
+        filename = os.fspath(filename)
+    if arcname is None:
+        arcname = filename
+    arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+    while arcname[0] in (os.sep, os.altsep):
+        arcname = arcname[1:]
+    if isdir:
+        arcname += "/"
+    return arcname
+
+
+def _zinfo_from_stat(filename, arcname, st, strict_timestamps=True):
+    """Construct a ZipInfo for a file on the filesystem from its already known stat result st,
+    e.g., from os.DirEntry.stat, instead of calling os.stat again."""
+    isdir = stat.S_ISDIR(st.st_mode)
+    mtime = time.localtime(st.st_mtime)
+    date_time = mtime[0:6]
+    if not strict_timestamps and date_time[0] < 1980:
+        date_time = (1980, 1, 1, 0, 0, 0)
+    elif not strict_timestamps and date_time[0] > 2107:
+        date_time = (2107, 12, 31, 23, 59, 59)
+    # Create ZipInfo instance to store file information
+    zinfo = ZipInfo(_arcname(filename, arcname, isdir), date_time)
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16  # Unix attributes
+    if isdir:
+        zinfo.file_size = 0
+        zinfo.external_attr |= 0x10  # MS-DOS directory flag
+    else:
+        zinfo.file_size = st.st_size
+    return zinfo
+
+
+def _check_zstd():
+    """Raise an error if Zstandard compression isn't available."""
+    if _zstd is None:
+        raise RuntimeError(
+            "Zstandard compression requires Python 3.14 or the backports.zstd package"
+        )
+
+
+class _ZstdCompressor:
+    """Zstandard compressor with the same interface as the compressors of zipfile. Empty input is
+    ignored, so that the compressed data doesn't depend on how the input is split into chunks."""
+
+    def __init__(self, compresslevel=None, workers=0):
+        _check_zstd()
+        options = {_zstd.CompressionParameter.nb_workers: workers}
+        if compresslevel is not None:
+            options[_zstd.CompressionParameter.compression_level] = compresslevel
+        self._compressor = _zstd.ZstdCompressor(options=options)
+
+    def compress(self, data):
+        return self._compressor.compress(data) if len(data) else b""
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def _compressor(zinfo, zstd_workers=0):
+    """Return a compressor for the compression settings of zinfo, like zipfile._get_compressor,
+    with support for Zstandard. zstd_workers is the number of threads Zstandard uses."""
+    if zinfo.compress_type == ZIP_ZSTANDARD:
+        return _ZstdCompressor(zinfo._compresslevel, zstd_workers)
+    return _get_compressor(zinfo.compress_type, zinfo._compresslevel)
+
+
+def _compress_member(zinfo, src, chunk_size=_CHUNK_SIZE, zstd_workers=0, mmap_threshold=None):
+    """Compress the data read from file-like object src according to the compression settings of
+    zinfo, without writing anything to an archive. Sets the CRC and sizes on zinfo, and returns a
+    temporary file holding the compressed data, rewound to the start. src is memory-mapped if
+    it's large enough, see _file_chunks."""
+    return _compress_chunks(zinfo, _file_chunks(src, chunk_size, mmap_threshold), zstd_workers)
+
+
+def _compress_chunks(zinfo, chunks, zstd_workers=0):
+    """Compress the data in the iterable of bytes-like chunks according to the compression
+    settings of zinfo, like _compress_member."""
+    compressor = _compressor(zinfo, zstd_workers)
+    spool = SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+    file_size = compress_size = crc = 0
+    for data in chunks:
+        file_size += len(data)
+        crc = crc32(data, crc)
+        if compressor:
+            data = compressor.compress(data)
+        compress_size += len(data)
+        spool.write(data)
+    if compressor:
+        data = compressor.flush()
+        compress_size += len(data)
+        spool.write(data)
+    zinfo.file_size = file_size
+    zinfo.compress_size = compress_size
+    zinfo.CRC = crc
+    spool.seek(0)
+    return spool
+
+
+def _read_chunks(fileobj, chunk_size):
+    """Yields chunks read from file-like object fileobj until it is exhausted."""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _peek_chunks(chunks, size):
+    """Return the first size bytes of the data in the iterable of bytes (or str) chunks, and an
+    iterator over all of the chunks, including those read to get the first bytes."""
+    chunks = iter(chunks)
+    head = []
+    length = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        head.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    return b"".join(head)[:size], chain(head, chunks)
+
+
+def _file_chunks(src, chunk_size, mmap_threshold=None):
+    """Yields the data of file object src in chunks. If mmap_threshold is not None and src is a
+    regular file of at least mmap_threshold bytes, the chunks are memoryview slices of a memory
+    map of the file, which can be passed to crc32 and compressors without being copied into
+    bytes objects first. Each slice is released when the next chunk is requested."""
+    if mmap_threshold is not None:
+        try:
+            st = os.fstat(src.fileno())
+            mapped = stat.S_ISREG(st.st_mode) and st.st_size and st.st_size >= mmap_threshold
+            mm = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) if mapped else None
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            mm = None
+        if mm is not None:
+            with mm, memoryview(mm) as view:
+                for start in range(0, len(view), chunk_size):
+                    with view[start : start + chunk_size] as chunk:
+                        yield chunk
+            return
+    yield from _read_chunks(src, chunk_size)
+
+
+def _compress_data(zinfo, data, zstd_workers=0):
+    """Compress bytes-like data according to the compression settings of zinfo. Sets the CRC and
+    sizes on zinfo, and returns the compressed data."""
+    if not isinstance(data, (bytes, bytearray)):
+        # Accept any data that supports the buffer protocol
+        data = memoryview(data).cast("B")
+    compressor = _compressor(zinfo, zstd_workers)
+    zinfo.file_size = len(data)
+    zinfo.CRC = crc32(data)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    zinfo.compress_size = len(data)
+    return data
+
+
+def _stored_member(zinfo, src, chunk_size=_CHUNK_SIZE, mmap_threshold=None):
+    """Set the CRC and sizes on zinfo for storing the data of src uncompressed, so that the data
+    can then be copied from the file as-is, and rewind src. The file is read in chunks, or memory
+    mapped, as for _file_chunks. Returns False, leaving zinfo unchanged, if src is not a regular
+    file or reports a size of 0."""
+    try:
+        st = os.fstat(src.fileno())
+    except (OSError, ValueError):
+        return False
+    # Some files report a size of 0 but have content, e.g., in /proc, so read those instead
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        return False
+    crc = size = 0
+    for data in _file_chunks(src, chunk_size, mmap_threshold):
+        crc = crc32(data, crc)
+        size += len(data)
+    src.seek(0)
+    zinfo.CRC = crc
+    zinfo.file_size = zinfo.compress_size = size
+    return True
+
+
+class _MemberDataReader:
+    """Read-only file-like object over the compressed data of a member of an open ZipFile."""
+
+    def __init__(self, zf, zinfo):
+        self._zf = zf
+        with zf._lock:
+            zf.fp.seek(zinfo.header_offset)
+            fheader = zf.fp.read(sizeFileHeader)
+        if len(fheader) != sizeFileHeader:
+            raise BadZipFile("Truncated file header")
+        fheader = struct.unpack(structFileHeader, fheader)
+        if fheader[_FH_SIGNATURE] != stringFileHeader:
+            raise BadZipFile("Bad magic number for file header")
+        self._pos = (
+            zinfo.header_offset
+            + sizeFileHeader
+            + fheader[_FH_FILENAME_LENGTH]
+            + fheader[_FH_EXTRA_FIELD_LENGTH]
+        )
+        self._end = self._pos + zinfo.compress_size
+
+    def read(self, n=-1):
+        if n < 0 or n > self._end - self._pos:
+            n = self._end - self._pos
+        with self._zf._lock:
+            self._zf.fp.seek(self._pos)
+            data = self._zf.fp.read(n)
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos):
+        self._pos = pos
+        return pos
+
+    def fileno(self):
+        return self._zf.fp.fileno()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def _kernel_copy(src_fd, dest_fd, offset, length):
+    """Copy up to length bytes starting at offset in src_fd to the current position of dest_fd,
+    within the kernel using os.copy_file_range or os.sendfile. Returns the number of bytes copied,
+    which is less than length if neither is supported for these files on this platform."""
+    copied = 0
+    use_copy_file_range = hasattr(os, "copy_file_range")
+    while copied < length:
+        count = min(length - copied, 1024 * 1024 * 1024)
+        try:
+            if use_copy_file_range:
+                n = os.copy_file_range(src_fd, dest_fd, count, offset + copied)
+            elif hasattr(os, "sendfile"):
+                n = os.sendfile(dest_fd, src_fd, offset + copied, count)
+            else:
+                break
+        except OSError:
+            if use_copy_file_range:
+                # e.g., copying across file systems on older kernels; try sendfile instead
+                use_copy_file_range = False
+                continue
+            break
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_data(src, dest, length, zero_copy=True):
+    """Copy length bytes from the current position of file-like object src to dest. If zero_copy
+    is true and both are regular files, the data is copied without passing through Python. Raises
+    EOFError if src ends before length bytes have been copied."""
+    # Only copy within the kernel to plain files, not wrappers like gzip.GzipFile that transform
+    # the data before writing it to the file descriptor they expose
+    if (
+        zero_copy
+        and isinstance(src, (io.BufferedReader, _MemberDataReader))
+        and isinstance(dest, _ZERO_COPY_TYPES)
+    ):
+        try:
+            src_fd = src.fileno()
+            dest_fd = dest.fileno()
+        except (AttributeError, OSError):
+            pass
+        else:
+            offset = src.tell()
+            dest.flush()
+            dest_start = dest.tell()
+            copied = _kernel_copy(src_fd, dest_fd, offset, length)
+            src.seek(offset + copied)
+            dest.seek(dest_start + copied)
+            length -= copied
+    while length > 0:
+        data = src.read(min(_CHUNK_SIZE, length))
+        if not data:
+            raise EOFError(f"Data ended {length} bytes short, e.g., the file was truncated")
+        dest.write(data)
+        length -= len(data)
+
+
+def _entropy(data):
+    """Return the Shannon entropy of bytes-like data in bits per byte."""
+    total = len(data)
+    return -sum(
+        count / total * math.log2(count / total) for count in sorted(Counter(data).values())
+    )
+
+
+class CompressionPolicy:
+    """Chooses the compression method and level of each member from its name and, optionally, a
+    sample of its content, e.g., to store files that are already compressed instead of spending
+    time compressing them again for no gain.
+
+    rules is a sequence of (pattern, compress_type) or (pattern, compress_type, compresslevel)
+    tuples. Patterns are glob patterns like "*.jpg" and are matched case-insensitively against the
+    base name of the member, or against the full archive name if they contain a "/". The first
+    matching rule wins. If store_compressed is true, members whose names match common formats of
+    already compressed data, such as "*.gz", "*.jpg", "*.parquet", and "*.whl", are stored when no
+    rule matches. If sample_size is positive, the first sample_size bytes of other members are
+    read, and members whose sample has an entropy of more than max_entropy bits per byte are
+    stored. Smaller samples say little about compressibility, so sample_size must be at least
+    1024 if positive, and members shorter than 1024 bytes are never stored for their entropy.
+
+    Pass an instance as the compression_policy argument of ReproducibleZipFile to use it. The
+    policy applies to members written without an explicit compress_type whose name is given as a
+    string. Since the choice only depends on the name and content of a member, archives remain
+    reproducible. Subclasses can override choose to implement other policies.
+    """
+
+    def __init__(self, rules=(), store_compressed=True, sample_size=0, max_entropy=7.5):
+        if 0 < sample_size < _MIN_SAMPLE_SIZE:
+            raise ValueError(f"sample_size must be 0 or at least {_MIN_SAMPLE_SIZE}")
+        self.rules = list(rules)
+        self.store_compressed = store_compressed
+        self.sample_size = sample_size
+        self.max_entropy = max_entropy
+
+    def choose(self, arcname, sample):
+        """Return the (compress_type, compresslevel) to use for the member arcname, or None to
+        use the archive's settings. sample holds up to sample_size bytes from the start of the
+        member's data. A compresslevel of None means the archive's compression level."""
+        name = arcname.lower()
+        base_name = name.rsplit("/", 1)[-1]
+        for pattern, *settings in self.rules:
+            pattern = pattern.lower()
+            if fnmatchcase(name if "/" in pattern else base_name, pattern):
+                compress_type, compresslevel = (settings + [None])[:2]
+                return compress_type, compresslevel
+        if self.store_compressed and any(
+            fnmatchcase(base_name, pattern) for pattern in _COMPRESSED_PATTERNS
+        ):
+            return ZIP_STORED, None
+        if len(sample) >= _MIN_SAMPLE_SIZE and _entropy(sample) > self.max_entropy:
+            return ZIP_STORED, None
+        return None
+
+
+class CompressionCache:
+    """On-disk cache of compressed member data, for reusing the compressed bytes of files whose
+    content has not changed since a previous archive was written. Entries are keyed by the SHA-256
+    hash of the uncompressed content, the compression method, the compression level, and the zlib
+    version, and they store the compressed data along with its CRC and sizes. When the total size
+    of the entries exceeds max_size bytes, the least recently used entries are evicted.
+
+    Pass an instance as the cache argument of ReproducibleZipFile to use it. A cache directory can
+    be shared by multiple processes.
+    """
+
+    _HEADER = struct.Struct("<4sLQQ")
+    _MAGIC = b"RZC1"
+    # Suffix of entries being written, which other writers must leave alone
+    _TEMP_SUFFIX = ".tmp"
+
+    def __init__(self, directory, max_size=1024**3):
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        """Yields (last access time, size, path) for every entry in the cache."""
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith(self._TEMP_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _path(self, digest, zinfo, zstd_workers=0):
+        version = ZLIB_RUNTIME_VERSION
+        if zinfo.compress_type == ZIP_ZSTANDARD:
+            # Zstandard output differs between its single-threaded and multithreaded modes
+            version = f"zstd-{_zstd.zstd_version}-{'mt' if zstd_workers else 'st'}"
+        key = hashlib.sha256(
+            f"{digest}-{zinfo.compress_type}-{zinfo._compresslevel}-{version}".encode()
+        ).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def _compress_file(
+        self, zinfo, src, chunk_size=_CHUNK_SIZE, zstd_workers=0, mmap_threshold=None
+    ):
+        """Return the compressed data of the file object src, positioned at its start, as a file
+        object, using the cached entry if there is one, and otherwise compressing it and adding it
+        to the cache. Sets the CRC and sizes on zinfo."""
+        digest = hashlib.sha256()
+        for data in _file_chunks(src, chunk_size, mmap_threshold):
+            digest.update(data)
+        path = self._path(digest.hexdigest(), zinfo, zstd_workers)
+
+        fp = self._load(path, zinfo)
+        if fp is not None:
+            return fp
+
+        src.seek(0)
+        spool = _compress_member(zinfo, src, chunk_size, zstd_workers, mmap_threshold)
+        self._store(path, zinfo, spool)
+        spool.seek(0)
+        return spool
+
+    def _load(self, path, zinfo):
+        try:
+            fp = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        header = fp.read(self._HEADER.size)
+        if len(header) == self._HEADER.size:
+            magic, crc, file_size, compress_size = self._HEADER.unpack(header)
+            if (
+                magic == self._MAGIC
+                and os.fstat(fp.fileno()).st_size == len(header) + compress_size
+            ):
+                zinfo.CRC = crc
+                zinfo.file_size = file_size
+                zinfo.compress_size = compress_size
+                # Modified time tracks last use for least recently used eviction
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    # Evicted by another writer since it was opened, which doesn't affect reading
+                    pass
+                return fp
+        # Incomplete or unrecognized entry, so treat as a miss and let it get replaced
+        fp.close()
+        return None
+
+    def _store(self, path, zinfo, spool):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename into place, so readers never see a partial entry
+        fp = NamedTemporaryFile(dir=os.path.dirname(path), suffix=self._TEMP_SUFFIX, delete=False)
+        try:
+            with fp:
+                fp.write(
+                    self._HEADER.pack(self._MAGIC, zinfo.CRC, zinfo.file_size, zinfo.compress_size)
+                )
+                shutil.copyfileobj(spool, fp, _CHUNK_SIZE)
+            os.replace(fp.name, path)
+        except BaseException:
+            # Don't leave a partial entry behind, e.g., if the disk is full
+            try:
+                os.remove(fp.name)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self._size += self._HEADER.size + zinfo.compress_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            for _, _, path in list(self._entries()):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+
+class MemberStats:
+    """Time spent and bytes processed writing one member of an archive, as collected by
+    WriteStats. Times are in seconds: stat_time getting the file's metadata, read_time reading
+    its data, compress_time computing the CRC and compressing, and write_time writing the member
+    to the archive. file_size and compress_size are the uncompressed and compressed sizes."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stat_time = 0.0
+        self.read_time = 0.0
+        self.compress_time = 0.0
+        self.write_time = 0.0
+        self.file_size = 0
+        self.compress_size = 0
+
+    @property
+    def ratio(self):
+        """Compressed size as a fraction of the uncompressed size."""
+        return self.compress_size / self.file_size if self.file_size else 1.0
+
+    def __repr__(self):
+        return (
+            f"<MemberStats {self.filename!r} stat={self.stat_time:.6f}s "
+            f"read={self.read_time:.6f}s compress={self.compress_time:.6f}s "
+            f"write={self.write_time:.6f}s file_size={self.file_size} "
+            f"compress_size={self.compress_size}>"
+        )
+
+
+class WriteStats:
+    """Instrumentation of the time spent and bytes processed writing archives, for finding out
+    whether getting file metadata, reading, compressing, or writing is the bottleneck.
+
+    Pass an instance as the stats argument of ReproducibleZipFile to use it. Its attributes hold
+    the totals over all members written so far, with the same meanings as for MemberStats, and
+    members is the number of members. If on_member is given, it's called with the MemberStats of
+    each member once it's written, in the order of the archive. One instance can collect stats
+    for several archives, including from multiple threads.
+
+    Members written with write_stream are recorded with the time spent reading, compressing, and
+    writing them all counted as compress time, since these happen together. For memory-mapped
+    files, see mmap_threshold, reading happens while computing the CRC and compressing and is
+    counted as such.
+    """
+
+    def __init__(self, on_member=None):
+        self.on_member = on_member
+        self.members = 0
+        self.stat_time = 0.0
+        self.read_time = 0.0
+        self.compress_time = 0.0
+        self.write_time = 0.0
+        self.file_size = 0
+        self.compress_size = 0
+        self._lock = threading.Lock()
+        # MemberStats of members being prepared, keyed by id of their ZipInfo, which is kept
+        # alive so that its id isn't reused
+        self._pending = {}
+
+    @property
+    def ratio(self):
+        """Compressed size as a fraction of the uncompressed size."""
+        return self.compress_size / self.file_size if self.file_size else 1.0
+
+    def summary(self):
+        """Return a human-readable summary of the totals."""
+        total = self.stat_time + self.read_time + self.compress_time + self.write_time
+        lines = [f"members: {self.members}"]
+        for phase in ("stat", "read", "compress", "write"):
+            seconds = getattr(self, f"{phase}_time")
+            share = seconds / total if total else 0.0
+            lines.append(f"{phase} time: {seconds:.3f}s ({share:.1%})")
+        lines.append(
+            f"bytes in: {self.file_size}, bytes out: {self.compress_size}, ratio: {self.ratio:.3f}"
+        )
+        return "\n".join(lines)
+
+    def _member(self, zinfo):
+        """Return the MemberStats of the member zinfo that is being prepared."""
+        entry = self._pending.get(id(zinfo))
+        if entry is None:
+            entry = self._pending[id(zinfo)] = (zinfo, MemberStats(zinfo.filename))
+        return entry[1]
+
+    def _finish(self, zinfo, write_time, key=None):
+        """Record the member zinfo as written, taking write_time seconds. key is the ZipInfo
+        used to prepare the member, if it's different from zinfo."""
+        entry = self._pending.pop(id(key if key is not None else zinfo), None)
+        member = entry[1] if entry is not None else MemberStats(zinfo.filename)
+        member.write_time += write_time
+        member.file_size = zinfo.file_size
+        member.compress_size = zinfo.compress_size
+        with self._lock:
+            self.members += 1
+            self.stat_time += member.stat_time
+            self.read_time += member.read_time
+            self.compress_time += member.compress_time
+            self.write_time += member.write_time
+            self.file_size += member.file_size
+            self.compress_size += member.compress_size
+        if self.on_member is not None:
+            self.on_member(member)
+
+
+class _TimedReader:
+    """Binary file-like object reading from file object src, adding the time spent in read to
+    the read_time of member, a MemberStats."""
+
+    def __init__(self, src, member):
+        self._src = src
+        self._member = member
+
+    def read(self, n=-1):
+        start = time.perf_counter()
+        data = self._src.read(n)
+        self._member.read_time += time.perf_counter() - start
+        return data
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        return self._src.seek(pos, whence)
+
+    def tell(self):
+        return self._src.tell()
+
+    def fileno(self):
+        return self._src.fileno()
+
+    def close(self):
+        self._src.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
 class ReproducibleZipFile(ZipFile):
     """Open a ZIP file, where file can be a path to a file (a string), a file-like object or a
     path-like object.
@@ -61,37 +844,192 @@ class ReproducibleZipFile(ZipFile):
     a reproducible ZIP archive. Other than overwriting these values, it works the same way as
     zipfile.ZipFile. For documentation on use, see the Python documentation for zipfile:
     https://docs.python.org/3/library/zipfile.html
+
+    The fixed values can be set with date_time, a 6-tuple like ZipInfo.date_time, and file_mode
+    and dir_mode, integer permissions modes like 0o644. They default to the values returned by
+    the functions of the same names. They are determined once when the archive is opened.
+
+    Optionally, pass a CompressionCache as cache to reuse previously compressed data for files
+    added with write or write_many, and a CompressionPolicy as compression_policy to choose the
+    compression of each member from its name and content. chunk_size sets the size in bytes of
+    the chunks that files are read in. If mmap_threshold is not None, files of at least that many
+    bytes are memory-mapped instead, and slices of the map are passed to the CRC and compressor
+    functions without copying, which saves time and memory allocations for very large files.
+
+    If streaming is true, members are always written with data descriptors after their data, as
+    zipfile.ZipFile does when file is not seekable, e.g., a pipe or a socket. The archive is then
+    the same whether it's written to a regular file or streamed, and file is never seeked.
+
+    ZIP_ZSTANDARD compression is supported on Python 3.14 and later, and on earlier versions if
+    the backports.zstd package is installed. zstd_workers is the number of threads used to
+    compress each Zstandard member. Zstandard's multithreaded mode produces different data from
+    its default single-threaded mode, which is used if zstd_workers is 0, but the same data for
+    any number of threads of 1 or more.
+
+    Pass a WriteStats as stats to record the time spent getting file metadata, reading,
+    compressing, and writing each member, along with its sizes.
+
+    If concurrent is true, write and writestr can be called from several threads at once. Each
+    call reads and compresses its member without holding the archive's lock, and only appending
+    the compressed member is serialized, so compression runs in parallel. The archive is the same
+    as with concurrent false, but members are written in the order the calls finish, so use sort
+    too if that order isn't deterministic.
+
+    If sort is true, members are written in order of their names, or of sort_key(name) if
+    sort_key is given, instead of the order they were added in. Their compressed data is spooled
+    to a temporary file and the archive is assembled when it's closed, so members can be added in
+    any order, e.g., from several threads at once, and the archive is still reproducible. Members
+    with the same key are ordered by name, then by CRC-32 and sizes. Members can't be written
+    through open in this mode.
     """
 
+    def __init__(
+        self,
+        file,
+        mode="r",
+        compression=ZIP_STORED,
+        allowZip64=True,
+        compresslevel=None,
+        *,
+        date_time=None,
+        file_mode=None,
+        dir_mode=None,
+        cache=None,
+        compression_policy=None,
+        chunk_size=_CHUNK_SIZE,
+        mmap_threshold=None,
+        streaming=False,
+        zstd_workers=0,
+        stats=None,
+        concurrent=False,
+        sort=False,
+        sort_key=None,
+        **kwargs,
+    ):
+        # Only needed for writing, so reading doesn't fail on invalid environment variables
+        self._date_time = self._file_attr = self._dir_attr = None
+        if mode != "r":
+            self._date_time, self._file_attr, self._dir_attr = _resolve_metadata(
+                date_time, file_mode, dir_mode
+            )
+        self.cache = cache
+        self.compression_policy = compression_policy
+        self.chunk_size = chunk_size
+        self.mmap_threshold = mmap_threshold
+        self.streaming = streaming
+        self.zstd_workers = zstd_workers
+        self.stats = stats
+        self.concurrent = concurrent
+        self.sort = sort
+        self.sort_key = sort_key
+        # Members to write in sorted order when closing, as (zinfo, offset, stats key,
+        # force_zip64) tuples, where offset is the position of compressed data in _sort_spool,
+        # or None for a directory, see sort
+        self._deferred = [] if sort and mode != "r" else None
+        self._sort_spool = None
+        # Open ZipFile whose unchanged members' compressed data is reused, see update
+        self._reuse = None
+        if compression == ZIP_ZSTANDARD:
+            # zipfile may not support Zstandard, so check it here, then set it after opening
+            _check_zstd()
+            compression = ZIP_STORED
+            super().__init__(file, mode, compression, allowZip64, compresslevel, **kwargs)
+            self.compression = ZIP_ZSTANDARD
+        else:
+            super().__init__(file, mode, compression, allowZip64, compresslevel, **kwargs)
+        # Data can be copied within the kernel only to a plain file, which zipfile wraps if its
+        # position can't be told, and not through wrappers like gzip.GzipFile
+        self._zero_copy = isinstance(self.fp, _ZERO_COPY_TYPES)
+        if streaming:
+            # Write the archive as zipfile does for an unseekable file, which uses data
+            # descriptors and never seeks
+            self._seekable = False
+
     # Following method modified from Python 3.11
     # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1763-L1794
     # Copyright Python Software Foundation, licensed under PSF License Version 2
     # See LICENSE file for full license agreement and notice of copyright
-    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
-        """Put the bytes from filename into the archive under the name arcname."""
+    def write(
+        self,
+        filename,
+        arcname=None,
+        compress_type=None,
+        compresslevel=None,
+        *,
+        stat_result=None,
+        file_size=None,
+    ):
+        """Put the bytes from filename into the archive under the name arcname. filename can also
+        be an os.DirEntry, e.g., from os.scandir, whose cached stat result is reused. If the
+        caller already has the file's metadata, pass stat_result, an os.stat_result, or for a
+        regular file just file_size, its size in bytes, to not get it from the filesystem again."""
 
         if not self.fp:
             raise ValueError("Attempt to write to ZIP archive that was already closed")
         if self._writing:
             raise ValueError("Can't write to ZIP archive while an open writing handle exists")
 
-        zinfo = ZipInfo.from_file(filename, arcname, strict_timestamps=self._strict_timestamps)
-
         ## repro-zipfile ADDED ##
-        # Overwrite date_time and extrnal_attr (permissions mode)
-        zinfo = copy(zinfo)
-        zinfo.date_time = date_time()
+        if isinstance(filename, os.DirEntry):
+            if stat_result is None and file_size is None:
+                stat_result = filename.stat()
+            filename = filename.path
+        zinfo = self._file_zinfo(
+            filename, arcname, compress_type, compresslevel, stat_result, file_size
+        )
+        #########################
+
         if zinfo.is_dir():
-            zinfo.external_attr = (0o40000 | dir_mode()) << 16
-            zinfo.external_attr |= 0x10  # MS-DOS directory flag
+            self.mkdir(zinfo)
+        elif (
+            self.cache is not None
+            or self._detached
+            or zinfo.compress_type in (ZIP_STORED, ZIP_ZSTANDARD)
+        ):
+            with self._compress_file(zinfo, filename) as src:
+                self._write_compressed(zinfo, src)
+        else:
+            with open(filename, "rb") as src, self.open(zinfo, "w") as dest:
+                ## repro-zipfile ADDED ##
+                # Read the file in chunks, or pass slices of a memory map of it, see mmap_threshold
+                for chunk in _file_chunks(src, self.chunk_size, self.mmap_threshold):
+                    dest.write(chunk)
+                #########################
+
+    # Following method modified from Python 3.11, split out of write
+    # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1763-L1794
+    # Copyright Python Software Foundation, licensed under PSF License Version 2
+    # See LICENSE file for full license agreement and notice of copyright
+    def _file_zinfo(
+        self, filename, arcname, compress_type, compresslevel, st=None, file_size=None
+    ):
+        """Create the normalized ZipInfo used to write filename into the archive. If st is given,
+        it is used as the stat result of filename instead of calling os.stat. Otherwise, if
+        file_size is given, filename is taken to be a regular file of that size."""
+        ## repro-zipfile ADDED ##
+        if self.stats is not None:
+            start = time.perf_counter()
+        # Reuse a stat result the caller already has, e.g., from os.scandir
+        if st is not None:
+            zinfo = _zinfo_from_stat(filename, arcname, st, self._strict_timestamps)
+        elif file_size is not None:
+            # The timestamp and mode are overwritten below, so only the size is needed
+            zinfo = ZipInfo(_arcname(filename, arcname), self._date_time)
+            zinfo.file_size = file_size
         else:
-            zinfo.external_attr = file_mode() << 16
+            zinfo = ZipInfo.from_file(filename, arcname, strict_timestamps=self._strict_timestamps)
+        if self.stats is not None:
+            self.stats._member(zinfo).stat_time += time.perf_counter() - start
+        #########################
+
+        ## repro-zipfile ADDED ##
+        # Overwrite date_time and extrnal_attr (permissions mode)
+        self._normalize(zinfo)
         #########################
 
         if zinfo.is_dir():
             zinfo.compress_size = 0
             zinfo.CRC = 0
-            self.mkdir(zinfo)
         else:
             if compress_type is not None:
                 zinfo.compress_type = compress_type
@@ -103,8 +1041,295 @@ class ReproducibleZipFile(ZipFile):
             else:
                 zinfo._compresslevel = self.compresslevel
 
-            with open(filename, "rb") as src, self.open(zinfo, "w") as dest:
-                shutil.copyfileobj(src, dest, 1024 * 8)
+            ## repro-zipfile ADDED ##
+            if compress_type is None and self.compression_policy is not None:
+                sample = b""
+                if self.compression_policy.sample_size > 0:
+                    with open(filename, "rb") as src:
+                        sample = src.read(self.compression_policy.sample_size)
+                self._apply_policy(zinfo, sample, compresslevel)
+            #########################
+        return zinfo
+
+    @property
+    def _detached(self):
+        """Whether write and writestr compress members before taking the lock to append them,
+        rather than writing through open: when they may be called concurrently, when compressing
+        is timed separately from writing, and when members are sorted."""
+        return self.concurrent or self.stats is not None or self._deferred is not None
+
+    def _apply_policy(self, zinfo, sample, compresslevel=None):
+        """Set the compression of zinfo as chosen by the compression policy from its name and
+        sample, a bytes-like object with the start of its data. An explicit compresslevel takes
+        precedence over the level chosen."""
+        choice = self.compression_policy.choose(zinfo.filename, sample)
+        if choice is not None:
+            zinfo.compress_type, policy_level = choice
+            if compresslevel is None and policy_level is not None:
+                zinfo._compresslevel = policy_level
+
+    def write_many(self, filenames, compress_type=None, compresslevel=None, workers=None):
+        """Put the bytes from each of filenames into the archive, compressing members concurrently
+        in a pool of worker threads. Each item of filenames is either a path, a (path, arcname)
+        tuple, or an os.DirEntry, e.g., from os.scandir, whose cached stat result is reused.
+        Members are written in the order given, and the resulting archive is identical to calling
+        write on each item in turn. workers defaults to the number of CPUs."""
+
+        if not self.fp:
+            raise ValueError("Attempt to write to ZIP archive that was already closed")
+        if self._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+        _prepare_many(
+            partial(self._prepare_file, compress_type=compress_type, compresslevel=compresslevel),
+            self._append_prepared,
+            filenames,
+            workers,
+        )
+
+    def _prepare_file(self, item, compress_type, compresslevel):
+        """Create the ZipInfo for an item of write_many and compress its data, without writing
+        anything to the archive. Returns the ZipInfo and the compressed data, which is None for a
+        directory. Safe to call from multiple threads at once."""
+        st = None
+        if isinstance(item, os.DirEntry):
+            filename, arcname, st = item.path, None, item.stat()
+        elif isinstance(item, tuple):
+            filename, arcname = item
+        else:
+            filename, arcname = item, None
+        zinfo = self._file_zinfo(filename, arcname, compress_type, compresslevel, st)
+        if zinfo.is_dir():
+            return zinfo, None
+        return zinfo, self._compress_file(zinfo, filename)
+
+    def _append_prepared(self, zinfo, src):
+        """Append a member prepared by _prepare_file to the archive."""
+        if src is None:
+            self.mkdir(zinfo)
+        else:
+            with src:
+                self._write_compressed(zinfo, src)
+
+    def copy_member(self, zf, member, arcname=None):
+        """Copy a member of another archive into this archive under the name arcname, without
+        decompressing and recompressing its data. zf is a ZipFile open for reading, and member is
+        the name of the member or its ZipInfo. Only the metadata is normalized: the timestamp and
+        permissions mode are set to their fixed values and extra fields are dropped."""
+
+        if not self.fp:
+            raise ValueError("Attempt to write to ZIP archive that was already closed")
+        if self._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+
+        src_zinfo = member if isinstance(member, ZipInfo) else zf.getinfo(member)
+        if src_zinfo.flag_bits & _MASK_ENCRYPTED:
+            raise ValueError("Can't copy encrypted member %r" % src_zinfo.filename)
+
+        if arcname is None:
+            arcname = src_zinfo.filename
+        arcname = os.fspath(arcname)
+        if src_zinfo.is_dir() and not arcname.endswith("/"):
+            arcname += "/"
+        zinfo = ZipInfo(arcname)
+        self._normalize(zinfo)
+
+        if zinfo.is_dir():
+            # Directories have no data, even if the source compressed an empty string for them
+            zinfo.CRC = zinfo.file_size = zinfo.compress_size = 0
+            self.mkdir(zinfo)
+        else:
+            zinfo.compress_type = src_zinfo.compress_type
+            zinfo.CRC = src_zinfo.CRC
+            zinfo.file_size = src_zinfo.file_size
+            zinfo.compress_size = src_zinfo.compress_size
+            with _MemberDataReader(zf, src_zinfo) as src:
+                self._write_compressed(zinfo, src)
+
+    def _normalize(self, zinfo):
+        """Overwrite date_time and external_attr (permissions mode) of zinfo with fixed values."""
+        zinfo.date_time = self._date_time
+        zinfo.external_attr = self._dir_attr if zinfo.is_dir() else self._file_attr
+
+    def _compress_file(self, zinfo, filename):
+        """Return the compressed data for filename as a file object, without writing anything to
+        the archive. Sets the CRC and sizes on zinfo, and records the time taken in stats."""
+        member = self.stats._member(zinfo) if self.stats is not None else None
+        if member is not None:
+            start = time.perf_counter()
+        src = open(filename, "rb")
+        if zinfo.compress_type == ZIP_STORED and _stored_member(
+            zinfo, src, self.chunk_size, self.mmap_threshold
+        ):
+            # The file itself holds the data to write, so there's nothing to compress or cache
+            if member is not None:
+                member.read_time += time.perf_counter() - start
+            return src
+        if member is not None:
+            src = _TimedReader(src, member)
+        with src:
+            data = None
+            if self._reuse is not None:
+                data = self._reuse_member(zinfo, src)
+                src.seek(0)
+            if data is None and self.cache is not None:
+                data = self.cache._compress_file(
+                    zinfo, src, self.chunk_size, self.zstd_workers, self.mmap_threshold
+                )
+            if data is None:
+                data = _compress_member(
+                    zinfo, src, self.chunk_size, self.zstd_workers, self.mmap_threshold
+                )
+        if member is not None:
+            member.compress_time += time.perf_counter() - start - member.read_time
+        return data
+
+    def _compress_bytes(self, zinfo, data):
+        """Compress bytes-like data according to the compression settings of zinfo, like
+        _compress_data, and record the time taken in stats."""
+        if self.stats is None:
+            return _compress_data(zinfo, data, self.zstd_workers)
+        start = time.perf_counter()
+        data = _compress_data(zinfo, data, self.zstd_workers)
+        self.stats._member(zinfo).compress_time += time.perf_counter() - start
+        return data
+
+    def _reuse_member(self, zinfo, src):
+        """Return a reader over the compressed data of the member of the same name in the archive
+        being updated, if the data of file object src is unchanged from it, i.e., has the same
+        size and CRC-32 and uses the same compression method. Otherwise returns None."""
+        try:
+            existing = self._reuse.getinfo(zinfo.filename)
+        except KeyError:
+            return None
+        if (
+            existing.compress_type != zinfo.compress_type
+            or existing.file_size != zinfo.file_size
+            or existing.flag_bits & _MASK_ENCRYPTED
+        ):
+            return None
+        crc = 0
+        for data in _file_chunks(src, self.chunk_size, self.mmap_threshold):
+            crc = crc32(data, crc)
+        if crc != existing.CRC:
+            return None
+        zinfo.CRC = existing.CRC
+        zinfo.compress_size = existing.compress_size
+        return _MemberDataReader(self._reuse, existing)
+
+    # Following method modified from Python 3.11 ZipFile._open_to_write and _ZipWriteFile.close
+    # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py
+    # Copyright Python Software Foundation, licensed under PSF License Version 2
+    # See LICENSE file for full license agreement and notice of copyright
+    def _write_compressed(self, zinfo, src, force_zip64=False):
+        """Append a member whose data has already been compressed. zinfo must have its CRC and
+        sizes set, and src is a file-like object with the compressed data. Writes the same bytes
+        as writing the uncompressed data through open(zinfo, "w", force_zip64=force_zip64)."""
+        with self._lock:
+            if not self.fp:
+                raise ValueError("Attempt to write to ZIP archive that was already closed")
+            if self._writing:
+                raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+
+            if self._seekable:
+                self.fp.seek(self.start_dir)
+            self._append_member(zinfo, src, force_zip64)
+
+    def _writecheck(self, zinfo):
+        """Check for errors before writing a file to the archive, allowing Zstandard compression
+        even if zipfile doesn't support it."""
+        if zinfo.compress_type == ZIP_ZSTANDARD:
+            _check_zstd()
+            zinfo = copy(zinfo)
+            zinfo.compress_type = ZIP_STORED
+        super()._writecheck(zinfo)
+
+    def _member_size(self, zinfo, is_dir=False):
+        """Return the number of bytes that appending the member zinfo, with its CRC and sizes set,
+        adds to the archive: the exact size of its local header, data, and data descriptor, and
+        an upper bound on the size of its central directory entry."""
+        filename, _ = zinfo._encodeFilenameFlags()
+        header_size = sizeFileHeader + len(filename) + len(zinfo.extra)
+        # Central directory entries have a ZIP64 extra field of at most three 8-byte values
+        central_size = sizeCentralDir + len(filename) + len(zinfo.extra) + len(zinfo.comment) + 28
+        if is_dir:
+            return header_size, central_size
+        zip64 = zinfo.file_size * 1.05 > ZIP64_LIMIT
+        local_size = header_size + zinfo.compress_size
+        if zip64:
+            local_size += 20
+        if not self._seekable:
+            local_size += struct.calcsize("<LLQQ" if zip64 else "<LLLL")
+        return local_size, central_size
+
+    # Following method modified from Python 3.11 ZipFile._open_to_write and _ZipWriteFile.close
+    # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py
+    # Copyright Python Software Foundation, licensed under PSF License Version 2
+    # See LICENSE file for full license agreement and notice of copyright
+    def _append_member(self, zinfo, data, force_zip64=False):
+        """Write the local header and compressed data of a member at the current position of the
+        archive. data is either a bytes-like object or a file-like object. If force_zip64 is true,
+        ZIP64 extensions are used regardless of the member's size. The caller must hold the lock
+        and have positioned the archive at start_dir."""
+        if self._deferred is not None:
+            self._defer_member(zinfo, data, force_zip64)
+            return
+        if self.stats is not None:
+            start = time.perf_counter()
+        header, zip64 = self._member_header(zinfo, force_zip64)
+        self.fp.write(header)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.fp.write(data)
+            end = zinfo.header_offset + len(header) + len(data)
+        else:
+            _copy_data(data, self.fp, zinfo.compress_size, zero_copy=self._zero_copy)
+            end = self.fp.tell()
+        descriptor = self._data_descriptor(zinfo, zip64)
+        if descriptor:
+            self.fp.write(descriptor)
+            end += len(descriptor)
+        self.start_dir = end
+
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+        if self.stats is not None:
+            self.stats._finish(zinfo, time.perf_counter() - start)
+
+    def _member_header(self, zinfo, force_zip64=False):
+        """Set the flags and header offset of a member to be appended at start_dir, and check that
+        it can be written. Returns its local header and whether it uses ZIP64 extensions. The
+        caller must hold the lock."""
+        zinfo.flag_bits = 0x00
+        if zinfo.compress_type == ZIP_LZMA:
+            # Compressed data includes an end-of-stream (EOS) marker
+            zinfo.flag_bits |= _MASK_COMPRESS_OPTION_1
+        elif zinfo.compress_type == ZIP_ZSTANDARD:
+            # Set as zipfile does in Python 3.14, which earlier versions don't know to do
+            zinfo.create_version = max(zinfo.create_version, _ZSTANDARD_VERSION)
+            zinfo.extract_version = max(zinfo.extract_version, _ZSTANDARD_VERSION)
+        if not self._seekable:
+            zinfo.flag_bits |= _MASK_USE_DATA_DESCRIPTOR
+
+        # Compressed size can be larger than uncompressed size
+        zip64 = force_zip64 or zinfo.file_size * 1.05 > ZIP64_LIMIT
+        if not self._allowZip64 and zip64:
+            raise LargeZipFile("Filesize would require ZIP64 extensions")
+        if not zip64 and zinfo.compress_size > ZIP64_LIMIT:
+            raise RuntimeError("Compressed size too large, try using force_zip64")
+
+        # Archive is positioned at start_dir, so no need to ask the file for its position
+        zinfo.header_offset = self.start_dir
+
+        self._writecheck(zinfo)
+        self._didModify = True
+        return zinfo.FileHeader(zip64), zip64
+
+    def _data_descriptor(self, zinfo, zip64):
+        """Return the data descriptor with the CRC and file sizes written after the data of a
+        member, or empty bytes if it doesn't have one."""
+        if not zinfo.flag_bits & _MASK_USE_DATA_DESCRIPTOR:
+            return b""
+        fmt = "<LLQQ" if zip64 else "<LLLL"
+        return struct.pack(fmt, _DD_SIGNATURE, zinfo.CRC, zinfo.compress_size, zinfo.file_size)
 
     # Following method modified from Python 3.11
     # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1796-L1835
@@ -116,89 +1341,756 @@ class ReproducibleZipFile(ZipFile):
         either a ZipInfo instance or the name of the file in the archive."""
         if isinstance(data, str):
             data = data.encode("utf-8")
+        zinfo = self._data_zinfo(zinfo_or_arcname, compress_type, compresslevel, data)
+
+        if not self.fp:
+            raise ValueError("Attempt to write to ZIP archive that was already closed")
+        if self._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists.")
+
+        ## repro-zipfile ADDED ##
+        # Compress Zstandard members here, since zipfile may not support it, and other members
+        # that are compressed before taking the lock, see _detached
+        if zinfo.compress_type == ZIP_ZSTANDARD or self._detached:
+            self._write_compressed(zinfo, self._compress_bytes(zinfo, data))
+            return
+        #########################
+
+        zinfo.file_size = len(data)  # Uncompressed size
+        with self._lock:
+            with self.open(zinfo, mode="w") as dest:
+                dest.write(data)
+
+    # Following method modified from Python 3.11, split out of writestr
+    # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1796-L1835
+    # Copyright Python Software Foundation, licensed under PSF License Version 2
+    # See LICENSE file for full license agreement and notice of copyright
+    def _data_zinfo(self, zinfo_or_arcname, compress_type, compresslevel, data=None):
+        """Create the normalized ZipInfo used to write data into the archive. data, if given, is
+        the member's bytes-like data, sampled by the compression policy."""
         if not isinstance(zinfo_or_arcname, ZipInfo):
-            zinfo = ZipInfo(filename=zinfo_or_arcname, date_time=time.localtime(time.time())[:6])
+            zinfo = ZipInfo(filename=zinfo_or_arcname)
             zinfo.compress_type = self.compression
             zinfo._compresslevel = self.compresslevel
-            if zinfo.filename.endswith("/"):
-                zinfo.external_attr = 0o40775 << 16  # drwxrwxr-x
-                zinfo.external_attr |= 0x10  # MS-DOS directory flag
-            else:
-                zinfo.external_attr = 0o600 << 16  # ?rw-------
         else:
-            zinfo = zinfo_or_arcname
+            ## repro-zipfile ADDED ##
+            # Copy so that the caller's ZipInfo isn't modified
+            zinfo = copy(zinfo_or_arcname)
+            #########################
 
         ## repro-zipfile ADDED ##
         # Overwrite date_time and extrnal_attr (permissions mode)
-        zinfo = copy(zinfo)
-        zinfo.date_time = date_time()
-        if zinfo.is_dir():
-            zinfo.external_attr = (0o40000 | dir_mode()) << 16
-            zinfo.external_attr |= 0x10  # MS-DOS directory flag
-        else:
-            zinfo.external_attr = file_mode() << 16
+        self._normalize(zinfo)
         #########################
 
+        if compress_type is not None:
+            zinfo.compress_type = compress_type
+
+        if compresslevel is not None:
+            zinfo._compresslevel = compresslevel
+
+        ## repro-zipfile ADDED ##
+        if (
+            compress_type is None
+            and self.compression_policy is not None
+            and not isinstance(zinfo_or_arcname, ZipInfo)
+        ):
+            sample = b""
+            if data is not None:
+                sample = memoryview(data)[: self.compression_policy.sample_size]
+            self._apply_policy(zinfo, sample, compresslevel)
+        #########################
+        return zinfo
+
+    def write_stream(
+        self, zinfo_or_arcname, data, size_hint=None, compress_type=None, compresslevel=None
+    ):
+        """Write a file into the archive from a stream of data, without holding all of it in
+        memory. 'data' is either a binary file-like object or an iterable of 'bytes' (or 'str')
+        chunks. If size_hint is the total size of the data in bytes, the result is identical to
+        writestr with the same data. If size_hint is None, the member is written with ZIP64
+        extensions (unless allowZip64 is False) so that it can hold data of any size."""
+        chunks = _read_chunks(data, self.chunk_size) if hasattr(data, "read") else data
+        ## repro-zipfile ADDED ##
+        # Read the start of the data for the compression policy to sample, as writestr does
+        sample = None
+        if (
+            compress_type is None
+            and self.compression_policy is not None
+            and self.compression_policy.sample_size > 0
+            and not isinstance(zinfo_or_arcname, ZipInfo)
+        ):
+            sample, chunks = _peek_chunks(chunks, self.compression_policy.sample_size)
+        #########################
+        zinfo = self._data_zinfo(zinfo_or_arcname, compress_type, compresslevel, sample)
+
         if not self.fp:
             raise ValueError("Attempt to write to ZIP archive that was already closed")
         if self._writing:
             raise ValueError("Can't write to ZIP archive while an open writing handle exists.")
 
-        if compress_type is not None:
-            zinfo.compress_type = compress_type
+        if size_hint is not None:
+            zinfo.file_size = size_hint
+            force_zip64 = False
+        else:
+            # Decide on ZIP64 from the arguments rather than the data, so output is reproducible
+            zinfo.file_size = 0
+            force_zip64 = self._allowZip64
 
-        if compresslevel is not None:
-            zinfo._compresslevel = compresslevel
+        if zinfo.compress_type == ZIP_ZSTANDARD or self._deferred is not None:
+            # zipfile may not support Zstandard, and members to be sorted are spooled anyway, so
+            # compress to a temporary file first
+            chunks = (
+                chunk.encode("utf-8") if isinstance(chunk, str) else chunk for chunk in chunks
+            )
+            if self.stats is not None:
+                start = time.perf_counter()
+            spool = _compress_chunks(zinfo, chunks, self.zstd_workers)
+            if self.stats is not None:
+                self.stats._member(zinfo).compress_time += time.perf_counter() - start
+            with spool:
+                self._write_compressed(zinfo, spool, force_zip64)
+            return
+        if self.stats is not None:
+            start = time.perf_counter()
+        with self._lock:
+            with self.open(zinfo, mode="w", force_zip64=force_zip64) as dest:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode("utf-8")
+                    dest.write(chunk)
+        if self.stats is not None:
+            self.stats._member(zinfo).compress_time += time.perf_counter() - start
+            self.stats._finish(zinfo, 0.0)
 
-        zinfo.file_size = len(data)  # Uncompressed size
+    def writestr_many(self, items, compress_type=None, compresslevel=None):
+        """Write many files into the archive from in-memory data. items is an iterable of
+        (zinfo_or_arcname, data) pairs, with the same meaning as the arguments of writestr. The
+        result is identical to calling writestr for each pair in turn, but with less overhead per
+        member: the lock is taken once and the bytes of many members are written at once."""
         with self._lock:
-            with self.open(zinfo, mode="w") as dest:
-                dest.write(data)
+            if not self.fp:
+                raise ValueError("Attempt to write to ZIP archive that was already closed")
+            if self._writing:
+                raise ValueError("Can't write to ZIP archive while an open writing handle exists.")
 
-    if sys.version_info < (3, 11):
-        # Following method modified from Python 3.11
-        # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1837-L1870
-        # Copyright Python Software Foundation, licensed under PSF License Version 2
-        # See LICENSE file for full license agreement and notice of copyright
-        def mkdir(self, zinfo_or_directory_name, mode=511):
-            """Creates a directory inside the zip archive."""
-            if isinstance(zinfo_or_directory_name, ZipInfo):
-                zinfo = zinfo_or_directory_name
-                if not zinfo.is_dir():
-                    raise ValueError("The given ZipInfo does not describe a directory")
-            elif isinstance(zinfo_or_directory_name, str):
-                directory_name = zinfo_or_directory_name
-                if not directory_name.endswith("/"):
-                    directory_name += "/"
-                zinfo = ZipInfo(directory_name)
-                zinfo.compress_size = 0
-                zinfo.CRC = 0
-                zinfo.external_attr = ((0o40000 | mode) & 0xFFFF) << 16
-                zinfo.file_size = 0
-                zinfo.external_attr |= 0x10
-            else:
-                raise TypeError("Expected type str or ZipInfo")
+            if self._seekable:
+                self.fp.seek(self.start_dir)
+            if self.stats is not None or self._deferred is not None:
+                for zinfo_or_arcname, data in items:
+                    if isinstance(data, str):
+                        data = data.encode("utf-8")
+                    zinfo = self._data_zinfo(zinfo_or_arcname, compress_type, compresslevel, data)
+                    self._append_member(zinfo, self._compress_bytes(zinfo, data))
+                return
 
-            ## repro-zipfile ADDED ##
-            # Overwrite date_time and extrnal_attr (permissions mode)
+            # Join the bytes of many members and write them at once, instead of making several
+            # small writes per member
+            buffer = []
+            buffered = 0
+            try:
+                for zinfo_or_arcname, data in items:
+                    if isinstance(data, str):
+                        data = data.encode("utf-8")
+                    zinfo = self._data_zinfo(zinfo_or_arcname, compress_type, compresslevel, data)
+                    data = _compress_data(zinfo, data, self.zstd_workers)
+                    header, zip64 = self._member_header(zinfo)
+                    descriptor = self._data_descriptor(zinfo, zip64)
+                    buffer += (header, data, descriptor)
+                    size = len(header) + len(data) + len(descriptor)
+                    buffered += size
+                    self.start_dir += size
+                    self.filelist.append(zinfo)
+                    self.NameToInfo[zinfo.filename] = zinfo
+                    if buffered >= _CHUNK_SIZE:
+                        self.fp.write(b"".join(buffer))
+                        buffer.clear()
+                        buffered = 0
+            finally:
+                # Members before an error are already in the central directory, so write them
+                self.fp.write(b"".join(buffer))
+
+    # Following method modified from Python 3.11
+    # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1837-L1870
+    # Copyright Python Software Foundation, licensed under PSF License Version 2
+    # See LICENSE file for full license agreement and notice of copyright
+    def mkdir(self, zinfo_or_directory_name, mode=511):
+        """Creates a directory inside the zip archive."""
+        if isinstance(zinfo_or_directory_name, ZipInfo):
+            zinfo = zinfo_or_directory_name
+            if not zinfo.is_dir():
+                raise ValueError("The given ZipInfo does not describe a directory")
+        elif isinstance(zinfo_or_directory_name, str):
+            directory_name = zinfo_or_directory_name
+            if not directory_name.endswith("/"):
+                directory_name += "/"
+            zinfo = ZipInfo(directory_name)
+            zinfo.compress_size = 0
+            zinfo.CRC = 0
+            zinfo.external_attr = ((0o40000 | mode) & 0xFFFF) << 16
+            zinfo.file_size = 0
+            zinfo.external_attr |= 0x10
+        else:
+            raise TypeError("Expected type str or ZipInfo")
+
+        ## repro-zipfile ADDED ##
+        # Overwrite date_time and extrnal_attr (permissions mode)
+        if zinfo is zinfo_or_directory_name:
+            # Copy so that the caller's ZipInfo isn't modified
             zinfo = copy(zinfo)
-            zinfo.date_time = date_time()
-            zinfo.external_attr = (0o40000 | dir_mode()) << 16
-            zinfo.external_attr |= 0x10  # MS-DOS directory flag
+        self._normalize(zinfo)
+        #########################
+
+        with self._lock:
+            ## repro-zipfile ADDED ##
+            if self._deferred is not None:
+                self._deferred.append((zinfo, None, zinfo_or_directory_name, False))
+                return
             #########################
+            self._append_dir(zinfo, zinfo_or_directory_name)
+
+    # Following method modified from Python 3.11, split out of mkdir
+    # https://github.com/python/cpython/blob/202efe1a3bcd499f3bf17bd953c6d36d47747e78/Lib/zipfile.py#L1837-L1870
+    # Copyright Python Software Foundation, licensed under PSF License Version 2
+    # See LICENSE file for full license agreement and notice of copyright
+    def _append_dir(self, zinfo, stats_key):
+        """Write the local header of the directory member zinfo. The caller must hold the lock.
+        stats_key is the argument its stats were recorded under, see WriteStats."""
+        if self.stats is not None:
+            start = time.perf_counter()
+        if self._seekable:
+            self.fp.seek(self.start_dir)
+        zinfo.header_offset = self.fp.tell()  # Start of header bytes
+        if zinfo.compress_type == ZIP_LZMA:
+            # Compressed data includes an end-of-stream (EOS) marker
+            zinfo.flag_bits |= _MASK_COMPRESS_OPTION_1
 
+        self._writecheck(zinfo)
+        self._didModify = True
+
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+        self.fp.write(zinfo.FileHeader(False))
+        self.start_dir = self.fp.tell()
+        if self.stats is not None:
+            self.stats._finish(zinfo, time.perf_counter() - start, stats_key)
+
+    def _defer_member(self, zinfo, data, force_zip64):
+        """Copy the compressed data of a member to the sort spool, to be written when the archive
+        is closed. The caller must hold the lock."""
+        if self._sort_spool is None:
+            self._sort_spool = TemporaryFile()
+        offset = self._sort_spool.seek(0, os.SEEK_END)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._sort_spool.write(data)
+        else:
+            _copy_data(data, self._sort_spool, zinfo.compress_size)
+        self._deferred.append((zinfo, offset, zinfo, force_zip64))
+
+    def _sorted_key(self, item):
+        """Return the key that deferred members are sorted by, which orders members with the same
+        name by their data so that the order doesn't depend on when they were added."""
+        zinfo = item[0]
+        key = zinfo.filename if self.sort_key is None else self.sort_key(zinfo.filename)
+        return key, zinfo.filename, zinfo.CRC, zinfo.file_size, zinfo.compress_size
+
+    def _write_deferred(self):
+        """Write the members deferred by sort in sorted order. The caller must hold the lock."""
+        deferred, self._deferred = self._deferred, None
+        spool, self._sort_spool = self._sort_spool, None
+        deferred.sort(key=self._sorted_key)
+        if self._seekable:
+            self.fp.seek(self.start_dir)
+        if spool is None:
+            for zinfo, _, stats_key, _ in deferred:
+                self._append_dir(zinfo, stats_key)
+            return
+        with spool:
+            spool.flush()
+            # Read through a BufferedReader so data can be copied within the kernel
+            with open(spool.fileno(), "rb", closefd=False) as reader:
+                for zinfo, offset, stats_key, force_zip64 in deferred:
+                    if offset is None:
+                        self._append_dir(zinfo, stats_key)
+                    else:
+                        reader.seek(offset)
+                        self._append_member(zinfo, reader, force_zip64)
+
+    def open(self, name, mode="r", pwd=None, *, force_zip64=False):
+        """Return file-like object for 'name'. Members can't be opened for writing if they are
+        sorted, see sort."""
+        if mode == "w" and self._deferred is not None:
+            raise ValueError("Can't open a member for writing when members are sorted")
+        return super().open(name, mode, pwd, force_zip64=force_zip64)
+
+    def close(self):
+        """Write the members deferred by sort, if any, then close the file."""
+        # Also called by ZipFile.__del__ if __init__ failed before setting these attributes
+        if getattr(self, "fp", None) is None:
+            return
+        if getattr(self, "_deferred", None) is not None:
             with self._lock:
-                if self._seekable:
-                    self.fp.seek(self.start_dir)
-                zinfo.header_offset = self.fp.tell()  # Start of header bytes
-                if zinfo.compress_type == ZIP_LZMA:
-                    # Compressed data includes an end-of-stream (EOS) marker
-                    zinfo.flag_bits |= _MASK_COMPRESS_OPTION_1
-
-                self._writecheck(zinfo)
-                self._didModify = True
-
-                self.filelist.append(zinfo)
-                self.NameToInfo[zinfo.filename] = zinfo
-                self.fp.write(zinfo.FileHeader(False))
-                self.start_dir = self.fp.tell()
+                self._write_deferred()
+        super().close()
+
+
+def _close_prepared(future):
+    """Close the compressed data of a member prepared in an executor that won't be written."""
+    if not future.cancelled() and future.exception() is None:
+        src = future.result()[1]
+        if hasattr(src, "close"):
+            src.close()
+
+
+def _prepare_many(prepare, append, items, workers=None):
+    """Call prepare(item) on each of items in a pool of worker threads, and append(*result) on
+    the results in the order of items. The number of items prepared ahead of the one being
+    appended is bounded, so memory use doesn't grow with the number of items. If an error is
+    raised, the results of items that won't be appended are closed. workers defaults to the
+    number of CPUs."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(prepare, item))
+                if len(pending) >= 2 * workers:
+                    append(*pending.popleft().result())
+            while pending:
+                append(*pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+                future.add_done_callback(_close_prepared)
+
+
+async def _aiter(iterable):
+    """Iterate over an iterable or an async iterable asynchronously."""
+    if hasattr(iterable, "__aiter__"):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
+
+
+class AsyncReproducibleZipFile:
+    """Asyncio interface for writing a ReproducibleZipFile without blocking the event loop. The
+    arguments are the same as for ReproducibleZipFile, which is opened as the zipfile attribute.
+
+    Reading and compressing files runs in executor, which defaults to the event loop's default
+    executor, for up to max_pending members at a time. Members are appended to the archive in the
+    order the calls were made, so the archive is identical to making the same calls on
+    ReproducibleZipFile. Calls can be awaited one at a time or run concurrently, e.g., with
+    asyncio.gather. max_pending defaults to twice the number of CPUs.
+    """
+
+    def __init__(
+        self,
+        file,
+        mode="r",
+        compression=ZIP_STORED,
+        allowZip64=True,
+        compresslevel=None,
+        *,
+        executor=None,
+        max_pending=None,
+        **kwargs,
+    ):
+        if max_pending is None:
+            max_pending = 2 * (os.cpu_count() or 1)
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self.zipfile = ReproducibleZipFile(
+            file, mode, compression, allowZip64, compresslevel, **kwargs
+        )
+        self.executor = executor
+        self.max_pending = max_pending
+        # Futures done when each of the most recent calls has finished, in call order
+        self._pending = deque()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    async def _run(self, prepare, append):
+        """Run prepare in the executor once fewer than max_pending earlier calls are in flight,
+        then run append with its result in the executor once all earlier calls have finished."""
+        loop = asyncio.get_running_loop()
+        previous = self._pending[-1] if self._pending else None
+        throttle = self._pending.popleft() if len(self._pending) >= self.max_pending else None
+        done = loop.create_future()
+        self._pending.append(done)
+
+        def finish(future=None):
+            if not done.done():
+                done.set_result(None)
+
+        appended = None
+        try:
+            if throttle is not None:
+                await asyncio.shield(throttle)
+            prepared = loop.run_in_executor(self.executor, prepare)
+            try:
+                if previous is not None:
+                    await asyncio.shield(previous)
+                result = await asyncio.shield(prepared)
+            except BaseException:
+                prepared.add_done_callback(_close_prepared)
+                raise
+            appended = loop.run_in_executor(self.executor, append, *result)
+            # Later calls must wait for the append to finish even if this call is cancelled
+            appended.add_done_callback(finish)
+            await asyncio.shield(appended)
+        finally:
+            if appended is None:
+                # Later calls must still wait for earlier calls if this call is cancelled
+                if previous is not None and not previous.done():
+                    previous.add_done_callback(finish)
+                else:
+                    finish()
+
+    async def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        """Put the bytes from filename into the archive under the name arcname."""
+        item = filename if arcname is None else (filename, arcname)
+        await self._run(
+            partial(self.zipfile._prepare_file, item, compress_type, compresslevel),
+            self.zipfile._append_prepared,
+        )
+
+    async def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        """Write a file into the archive. The contents is data, which may be either a str or a
+        bytes instance; if it is a str, it is encoded as UTF-8 first."""
+
+        def prepare():
+            encoded = data.encode("utf-8") if isinstance(data, str) else data
+            zinfo = self.zipfile._data_zinfo(
+                zinfo_or_arcname, compress_type, compresslevel, encoded
+            )
+            return zinfo, self.zipfile._compress_bytes(zinfo, encoded)
+
+        await self._run(prepare, self.zipfile._write_compressed)
+
+    async def mkdir(self, zinfo_or_directory_name, mode=511):
+        """Creates a directory inside the zip archive."""
+        await self._run(lambda: (zinfo_or_directory_name, mode), self.zipfile.mkdir)
+
+    async def _run_many(self, calls):
+        """Run the calls, each a coroutine for one member, with at most max_pending in flight.
+        Members are appended in order."""
+        tasks = deque()
+        try:
+            async for call in calls:
+                tasks.append(asyncio.ensure_future(call))
+                if len(tasks) >= self.max_pending:
+                    await tasks.popleft()
+            while tasks:
+                await tasks.popleft()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def write_many(self, filenames, compress_type=None, compresslevel=None):
+        """Put the bytes from each of filenames, an iterable or async iterable, into the archive.
+        Items are the same as for ReproducibleZipFile.write_many."""
+
+        async def calls():
+            async for item in _aiter(filenames):
+                filename, arcname = item if isinstance(item, tuple) else (item, None)
+                yield self.write(filename, arcname, compress_type, compresslevel)
+
+        await self._run_many(calls())
+
+    async def writestr_many(self, items, compress_type=None, compresslevel=None):
+        """Write many files into the archive from in-memory data. items is an iterable or async
+        iterable of (zinfo_or_arcname, data) pairs, with the same meaning as the arguments of
+        writestr."""
+
+        async def calls():
+            async for zinfo_or_arcname, data in _aiter(items):
+                yield self.writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+        await self._run_many(calls())
+
+    async def close(self):
+        """Wait for all pending calls to finish, then close the archive."""
+        if self._pending:
+            await asyncio.shield(self._pending[-1])
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.zipfile.close)
+
+
+class SplitReproducibleZipFile:
+    """Write reproducible ZIP archives split into parts of at most max_size bytes each. Each part
+    is a complete, self-contained archive holding a run of consecutive members, so parts can be
+    read, uploaded, or extracted independently. name_format is a format string for the paths of
+    the parts, e.g., "archive-{:03d}.zip", which is given the part number starting from 1.
+
+    A new part is started when the next member would make the current part larger than
+    max_size. Since members are compressed before they are assigned to a part, which part each
+    member goes into only depends on the inputs and settings, so it is reproducible. If given,
+    on_part is called with the path of each part after it has been closed, e.g., to upload it
+    while the following parts are written. Other arguments are passed to ReproducibleZipFile for
+    each part, and the paths of the parts written so far are in the parts attribute.
+    """
+
+    def __init__(
+        self,
+        name_format,
+        max_size,
+        compression=ZIP_STORED,
+        allowZip64=True,
+        compresslevel=None,
+        *,
+        on_part=None,
+        **kwargs,
+    ):
+        if max_size <= _PART_OVERHEAD:
+            raise ValueError(f"max_size must be larger than {_PART_OVERHEAD} bytes")
+        if kwargs.get("sort"):
+            # Members are assigned to parts as they are written, which needs them in call order
+            raise ValueError("sort is not supported for split archives")
+        self.name_format = name_format
+        self.max_size = max_size
+        self.on_part = on_part
+        self.parts = []
+        self._args = (compression, allowZip64, compresslevel)
+        self._kwargs = kwargs
+        self._part = None
+        self._central_size = 0
+        self._open_part()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        elif self._part.fp is not None:
+            # Don't pass on a part that may be missing members
+            self._part.close()
+
+    def _open_part(self):
+        path = self.name_format.format(len(self.parts) + 1)
+        self._part = ReproducibleZipFile(path, "w", *self._args, **self._kwargs)
+        self._central_size = 0
+        self.parts.append(path)
+
+    def _close_part(self):
+        self._part.close()
+        if self.on_part is not None:
+            self.on_part(self.parts[-1])
+
+    def _add(self, zinfo, src, append):
+        """Append a member whose data has been compressed to the current part with append(part,
+        zinfo, src), first starting a new part if the member doesn't fit in the current one."""
+        local_size, central_size = self._part._member_size(zinfo, is_dir=src is None)
+        if local_size + central_size + _PART_OVERHEAD > self.max_size:
+            if hasattr(src, "close"):
+                src.close()
+            raise ValueError(
+                f"Member {zinfo.filename!r} does not fit in a part of {self.max_size} bytes"
+            )
+        part_size = self._part.start_dir + self._central_size + _PART_OVERHEAD
+        if self._part.filelist and part_size + local_size + central_size > self.max_size:
+            self._close_part()
+            self._open_part()
+        append(self._part, zinfo, src)
+        self._central_size += central_size
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        """Put the bytes from filename into the archive under the name arcname."""
+        item = filename if arcname is None else (filename, arcname)
+        zinfo, src = self._part._prepare_file(item, compress_type, compresslevel)
+        self._add(zinfo, src, ReproducibleZipFile._append_prepared)
+
+    def write_many(self, filenames, compress_type=None, compresslevel=None, workers=None):
+        """Put the bytes from each of filenames into the archive, compressing members concurrently
+        in a pool of worker threads. Items and workers are the same as for
+        ReproducibleZipFile.write_many."""
+        _prepare_many(
+            lambda item: self._part._prepare_file(item, compress_type, compresslevel),
+            partial(self._add, append=ReproducibleZipFile._append_prepared),
+            filenames,
+            workers,
+        )
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        """Write a file into the archive. The contents is data, which may be either a str or a
+        bytes instance; if it is a str, it is encoded as UTF-8 first."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        zinfo = self._part._data_zinfo(zinfo_or_arcname, compress_type, compresslevel, data)
+        data = self._part._compress_bytes(zinfo, data)
+        self._add(zinfo, data, ReproducibleZipFile._write_compressed)
+
+    def mkdir(self, zinfo_or_directory_name, mode=511):
+        """Creates a directory inside the zip archive."""
+        if isinstance(zinfo_or_directory_name, ZipInfo):
+            zinfo = zinfo_or_directory_name
+        else:
+            zinfo = ZipInfo(zinfo_or_directory_name.rstrip("/") + "/")
+        self._add(zinfo, None, lambda part, *_: part.mkdir(zinfo_or_directory_name, mode))
+
+    def close(self):
+        """Close the last part."""
+        if self._part is not None and self._part.fp is not None:
+            self._close_part()
+
+
+def update(file, filenames, compression=ZIP_STORED, compresslevel=None, workers=None, **kwargs):
+    """Rewrite the ZIP archive at path file so that it contains filenames, as with
+    ReproducibleZipFile.write_many. Existing members whose source file is unchanged, i.e., has the
+    same size and CRC-32, and whose compression method is the same have their compressed data
+    copied over as-is, so only new and changed files are compressed. Since the compression level
+    of copied data can't be told from the archive, compresslevel can't be set, and copied members
+    keep the level they were written with. Levels chosen by a compression_policy only apply to new
+    and changed files. If file does not exist, a new archive is written. Other keyword arguments
+    are passed to ReproducibleZipFile.
+    """
+    if compresslevel is not None:
+        raise ValueError("compresslevel can't be set, as update copies compressed data as-is")
+    path = os.fspath(file)
+    if not os.path.exists(path):
+        with ReproducibleZipFile(
+            path, "w", compression, compresslevel=compresslevel, **kwargs
+        ) as zp:
+            zp.write_many(filenames, workers=workers)
+        return
+
+    # Write to a temporary file in the same directory, then replace the existing archive
+    with ZipFile(path, "r") as existing, NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(path)), delete=False
+    ) as tmp:
+        try:
+            with ReproducibleZipFile(
+                tmp, "w", compression, compresslevel=compresslevel, **kwargs
+            ) as zp:
+                zp._reuse = existing
+                zp.write_many(filenames, workers=workers)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    os.chmod(tmp.name, stat.S_IMODE(os.stat(path).st_mode))
+    os.replace(tmp.name, path)
+
+
+def normalize(src, dst, sort=True, **kwargs):
+    """Write a reproducible copy of the ZIP archive src to dst, without decompressing and
+    recompressing members. src and dst are paths or file-like objects. The compressed data of
+    each member is copied as-is, while its metadata is normalized as by ReproducibleZipFile: the
+    timestamp and permissions mode are set to their fixed values, and extra fields, such as
+    extended timestamps and Unix owner IDs, and comments are dropped. If sort is true, members
+    are written in order of their names, so the result doesn't depend on the order of src.
+    Other keyword arguments are passed to ReproducibleZipFile.
+    """
+    with ZipFile(src, "r") as zf, ReproducibleZipFile(dst, "w", **kwargs) as zp:
+        infos = zf.infolist()
+        if sort:
+            infos = sorted(infos, key=lambda zinfo: zinfo.filename)
+        for zinfo in infos:
+            zp.copy_member(zf, zinfo)
+
+
+class Difference(namedtuple("Difference", ["name", "field", "first", "second"])):
+    """A difference between two archives found by verify. name is the name of the member that
+    differs, or None for the archive as a whole. field is the attribute of ZipInfo that differs,
+    e.g., "date_time" or "external_attr", or one of:
+
+    - "local_extra": the extra field of the member's local header
+    - "data": the compressed data, compared only if verify's deep argument is true, with first
+      and second None
+    - "member": whether the archive has the member, with first and second True or False
+    - "comment" and "order": the archive comment and the order of members (for name None)
+
+    first and second are the values in the first and second archive.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        prefix = "archive" if self.name is None else self.name
+        return f"{prefix}: {self.field} differs: {self.first!r} != {self.second!r}"
+
+
+def _local_extra(zf, zinfo):
+    """Return the extra field of the local header of member zinfo of the open ZipFile zf."""
+    with zf._lock:
+        zf.fp.seek(zinfo.header_offset)
+        fheader = zf.fp.read(sizeFileHeader)
+        if len(fheader) != sizeFileHeader:
+            raise BadZipFile("Truncated file header")
+        fheader = struct.unpack(structFileHeader, fheader)
+        if fheader[_FH_SIGNATURE] != stringFileHeader:
+            raise BadZipFile("Bad magic number for file header")
+        zf.fp.seek(fheader[_FH_FILENAME_LENGTH], os.SEEK_CUR)
+        return zf.fp.read(fheader[_FH_EXTRA_FIELD_LENGTH])
+
+
+def _same_data(zf1, zinfo1, zf2, zinfo2, chunk_size=_CHUNK_SIZE):
+    """Return whether the compressed data of two members, of equal compress_size, is the same."""
+    with _MemberDataReader(zf1, zinfo1) as src1, _MemberDataReader(zf2, zinfo2) as src2:
+        while True:
+            data1 = src1.read(chunk_size)
+            if data1 != src2.read(chunk_size):
+                return False
+            if not data1:
+                return True
+
+
+def verify(file1, file2, deep=False, ignore=()):
+    """Compare two ZIP archives without extracting them, e.g., to check that an archive was
+    reproduced. Returns a list of Differences, which is empty if the archives have the same
+    members in the same order with the same metadata and content.
+
+    Only the central directories and the local header extra fields are read: the content of
+    members is compared by CRC-32 and sizes. If deep is true, the compressed data of members with
+    the same CRC-32 and compressed size is also compared byte for byte. ignore is a collection of
+    fields, as in Difference.field, to leave out of the comparison, e.g., {"date_time"}.
+    """
+    ignore = set(ignore)
+    differences = []
+    with ZipFile(file1, "r") as zf1, ZipFile(file2, "r") as zf2:
+        if "comment" not in ignore and zf1.comment != zf2.comment:
+            differences.append(Difference(None, "comment", zf1.comment, zf2.comment))
+
+        infos1 = {zinfo.filename: zinfo for zinfo in zf1.infolist()}
+        infos2 = {zinfo.filename: zinfo for zinfo in zf2.infolist()}
+        common1 = [name for name in infos1 if name in infos2]
+        common2 = [name for name in infos2 if name in infos1]
+        if "order" not in ignore and common1 != common2:
+            differences.append(Difference(None, "order", common1, common2))
+        if "member" not in ignore:
+            differences.extend(
+                Difference(name, "member", True, False) for name in infos1 if name not in infos2
+            )
+            differences.extend(
+                Difference(name, "member", False, True) for name in infos2 if name not in infos1
+            )
+
+        for name in common1:
+            zinfo1, zinfo2 = infos1[name], infos2[name]
+            member_differences = [
+                Difference(name, field, getattr(zinfo1, field), getattr(zinfo2, field))
+                for field in _VERIFY_FIELDS
+                if field not in ignore and getattr(zinfo1, field) != getattr(zinfo2, field)
+            ]
+            if "local_extra" not in ignore:
+                extra1, extra2 = _local_extra(zf1, zinfo1), _local_extra(zf2, zinfo2)
+                if extra1 != extra2:
+                    member_differences.append(Difference(name, "local_extra", extra1, extra2))
+            if (
+                deep
+                and "data" not in ignore
+                and zinfo1.CRC == zinfo2.CRC
+                and zinfo1.compress_size == zinfo2.compress_size
+                and not _same_data(zf1, zinfo1, zf2, zinfo2)
+            ):
+                member_differences.append(Difference(name, "data", None, None))
+            differences.extend(member_differences)
+    return differences
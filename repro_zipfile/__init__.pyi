@@ -1,22 +1,286 @@
-from zipfile import ZipFile, ZipInfo
+from collections.abc import AsyncIterable, Callable, Iterable
+from concurrent.futures import Executor
+from os import DirEntry, stat_result
+from types import TracebackType
+from typing import IO, Any, NamedTuple
+from zipfile import ZipFile, ZipInfo, _ZipFileMode
 
-from _typeshed import SizedBuffer, StrPath
+from _typeshed import SizedBuffer, StrPath, SupportsRead
+from typing_extensions import Self
 
-__all__ = ["date_time", "file_mode", "dir_mode", "ReproducibleZipFile"]
+__all__ = [
+    "date_time",
+    "file_mode",
+    "dir_mode",
+    "update",
+    "normalize",
+    "verify",
+    "Difference",
+    "CompressionCache",
+    "CompressionPolicy",
+    "MemberStats",
+    "WriteStats",
+    "ReproducibleZipFile",
+    "AsyncReproducibleZipFile",
+    "SplitReproducibleZipFile",
+    "ZIP_ZSTANDARD",
+]
 __version__: str
 
+ZIP_ZSTANDARD: int
+
 def date_time() -> tuple[int, int, int, int, int, int]: ...
 def file_mode() -> int: ...
 def dir_mode() -> int: ...
+def update(
+    file: StrPath,
+    filenames: Iterable[StrPath | DirEntry[str] | tuple[StrPath, StrPath | None]],
+    compression: int = 0,
+    compresslevel: None = None,
+    workers: int | None = None,
+    **kwargs: Any,
+) -> None: ...
+
+class CompressionCache:
+    directory: str
+    max_size: int
+    def __init__(self, directory: StrPath, max_size: int = 1073741824) -> None: ...
+    def clear(self) -> None: ...
+
+class CompressionPolicy:
+    rules: list[tuple[str, int] | tuple[str, int, int | None]]
+    store_compressed: bool
+    sample_size: int
+    max_entropy: float
+    def __init__(
+        self,
+        rules: Iterable[tuple[str, int] | tuple[str, int, int | None]] = (),
+        store_compressed: bool = True,
+        sample_size: int = 0,
+        max_entropy: float = 7.5,
+    ) -> None: ...
+    def choose(self, arcname: str, sample: SizedBuffer) -> tuple[int, int | None] | None: ...
+
+class MemberStats:
+    filename: str
+    stat_time: float
+    read_time: float
+    compress_time: float
+    write_time: float
+    file_size: int
+    compress_size: int
+    def __init__(self, filename: str) -> None: ...
+    @property
+    def ratio(self) -> float: ...
+
+class WriteStats:
+    on_member: Callable[[MemberStats], object] | None
+    members: int
+    stat_time: float
+    read_time: float
+    compress_time: float
+    write_time: float
+    file_size: int
+    compress_size: int
+    def __init__(self, on_member: Callable[[MemberStats], object] | None = None) -> None: ...
+    @property
+    def ratio(self) -> float: ...
+    def summary(self) -> str: ...
 
 class ReproducibleZipFile(ZipFile):
+    cache: CompressionCache | None
+    compression_policy: CompressionPolicy | None
+    chunk_size: int
+    mmap_threshold: int | None
+    streaming: bool
+    zstd_workers: int
+    stats: WriteStats | None
+    concurrent: bool
+    sort: bool
+    sort_key: Callable[[str], Any] | None
+    def __init__(
+        self,
+        file: StrPath | IO[bytes],
+        mode: _ZipFileMode = "r",
+        compression: int = 0,
+        allowZip64: bool = True,
+        compresslevel: int | None = None,
+        *,
+        date_time: tuple[int, int, int, int, int, int] | None = None,
+        file_mode: int | None = None,
+        dir_mode: int | None = None,
+        cache: CompressionCache | None = None,
+        compression_policy: CompressionPolicy | None = None,
+        chunk_size: int = 1048576,
+        mmap_threshold: int | None = None,
+        streaming: bool = False,
+        zstd_workers: int = 0,
+        stats: WriteStats | None = None,
+        concurrent: bool = False,
+        sort: bool = False,
+        sort_key: Callable[[str], Any] | None = None,
+        strict_timestamps: bool = True,
+        metadata_encoding: str | None = None,
+    ) -> None: ...
+    def write(
+        self,
+        filename: StrPath | DirEntry[str],
+        arcname: StrPath | None = None,
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+        *,
+        stat_result: stat_result | None = None,
+        file_size: int | None = None,
+    ) -> None: ...
+    def write_many(
+        self,
+        filenames: Iterable[StrPath | DirEntry[str] | tuple[StrPath, StrPath | None]],
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+        workers: int | None = None,
+    ) -> None: ...
+    def copy_member(
+        self, zf: ZipFile, member: str | ZipInfo, arcname: StrPath | None = None
+    ) -> None: ...
+    def writestr(
+        self,
+        zinfo_or_arcname: str | ZipInfo,
+        data: SizedBuffer | str,
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    def write_stream(
+        self,
+        zinfo_or_arcname: str | ZipInfo,
+        data: SupportsRead[bytes] | Iterable[bytes | str],
+        size_hint: int | None = None,
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    def writestr_many(
+        self,
+        items: Iterable[tuple[str | ZipInfo, SizedBuffer | str]],
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    def mkdir(self, zinfo_or_directory_name: str | ZipInfo, mode: int = 511) -> None: ...
+
+class AsyncReproducibleZipFile:
+    zipfile: ReproducibleZipFile
+    executor: Executor | None
+    max_pending: int
+    def __init__(
+        self,
+        file: StrPath | IO[bytes],
+        mode: _ZipFileMode = "r",
+        compression: int = 0,
+        allowZip64: bool = True,
+        compresslevel: int | None = None,
+        *,
+        executor: Executor | None = None,
+        max_pending: int | None = None,
+        date_time: tuple[int, int, int, int, int, int] | None = None,
+        file_mode: int | None = None,
+        dir_mode: int | None = None,
+        cache: CompressionCache | None = None,
+        compression_policy: CompressionPolicy | None = None,
+        chunk_size: int = 1048576,
+        mmap_threshold: int | None = None,
+        streaming: bool = False,
+        zstd_workers: int = 0,
+        stats: WriteStats | None = None,
+        concurrent: bool = False,
+        sort: bool = False,
+        sort_key: Callable[[str], Any] | None = None,
+        strict_timestamps: bool = True,
+        metadata_encoding: str | None = None,
+    ) -> None: ...
+    async def __aenter__(self) -> Self: ...
+    async def __aexit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None: ...
+    async def write(
+        self,
+        filename: StrPath | DirEntry[str],
+        arcname: StrPath | None = None,
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    async def writestr(
+        self,
+        zinfo_or_arcname: str | ZipInfo,
+        data: SizedBuffer | str,
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    async def mkdir(self, zinfo_or_directory_name: str | ZipInfo, mode: int = 511) -> None: ...
+    async def write_many(
+        self,
+        filenames: Iterable[StrPath | DirEntry[str] | tuple[StrPath, StrPath | None]]
+        | AsyncIterable[StrPath | DirEntry[str] | tuple[StrPath, StrPath | None]],
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    async def writestr_many(
+        self,
+        items: Iterable[tuple[str | ZipInfo, SizedBuffer | str]]
+        | AsyncIterable[tuple[str | ZipInfo, SizedBuffer | str]],
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+    ) -> None: ...
+    async def close(self) -> None: ...
+
+class SplitReproducibleZipFile:
+    name_format: str
+    max_size: int
+    on_part: Callable[[str], object] | None
+    parts: list[str]
+    def __init__(
+        self,
+        name_format: str,
+        max_size: int,
+        compression: int = 0,
+        allowZip64: bool = True,
+        compresslevel: int | None = None,
+        *,
+        on_part: Callable[[str], object] | None = None,
+        date_time: tuple[int, int, int, int, int, int] | None = None,
+        file_mode: int | None = None,
+        dir_mode: int | None = None,
+        cache: CompressionCache | None = None,
+        compression_policy: CompressionPolicy | None = None,
+        chunk_size: int = 1048576,
+        mmap_threshold: int | None = None,
+        streaming: bool = False,
+        zstd_workers: int = 0,
+        stats: WriteStats | None = None,
+        strict_timestamps: bool = True,
+        metadata_encoding: str | None = None,
+    ) -> None: ...
+    def __enter__(self) -> Self: ...
+    def __exit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None: ...
     def write(
         self,
-        filename: StrPath,
+        filename: StrPath | DirEntry[str],
         arcname: StrPath | None = None,
         compress_type: int | None = None,
         compresslevel: int | None = None,
     ) -> None: ...
+    def write_many(
+        self,
+        filenames: Iterable[StrPath | DirEntry[str] | tuple[StrPath, StrPath | None]],
+        compress_type: int | None = None,
+        compresslevel: int | None = None,
+        workers: int | None = None,
+    ) -> None: ...
     def writestr(
         self,
         zinfo_or_arcname: str | ZipInfo,
@@ -25,3 +289,21 @@ class ReproducibleZipFile(ZipFile):
         compresslevel: int | None = None,
     ) -> None: ...
     def mkdir(self, zinfo_or_directory_name: str | ZipInfo, mode: int = 511) -> None: ...
+    def close(self) -> None: ...
+
+def normalize(
+    src: StrPath | IO[bytes], dst: StrPath | IO[bytes], sort: bool = True, **kwargs: Any
+) -> None: ...
+
+class Difference(NamedTuple):
+    name: str | None
+    field: str
+    first: Any
+    second: Any
+
+def verify(
+    file1: StrPath | IO[bytes],
+    file2: StrPath | IO[bytes],
+    deep: bool = False,
+    ignore: Iterable[str] = (),
+) -> list[Difference]: ...
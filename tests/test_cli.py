@@ -1,16 +1,20 @@
 from glob import glob
+import io
 import subprocess
 import sys
+from zipfile import ZipFile, ZipInfo
 
 from typer.testing import CliRunner
 
+from repro_zipfile import MemberStats
 from repro_zipfile import __version__ as repro_zipfile_version
 from rpzip import __version__ as rpzip_version
-from rpzip import app
+from rpzip import _Progress, app
 from tests.utils import (
     assert_archive_contents_equals,
     dir_tree_factory,
     file_factory,
+    hash_file,
     remove_ansi_escape,
 )
 
@@ -84,6 +88,249 @@ def test_zip_multiple_recursive(base_path):
     assert_archive_contents_equals(rpzip_out, zip_out)
 
 
+def test_zip_recursive_nested_inputs(base_path):
+    """Recursive inputs that overlap are each added once, in sorted order."""
+    dir_tree = dir_tree_factory(base_path)
+    sub_dir = dir_tree / "sub_dir"
+    data_file = next(sub_dir.glob("*.txt"))
+
+    rpzip_out = base_path / "rpzip.zip"
+    rpzip_args = ["-r", str(rpzip_out), str(data_file), str(dir_tree), str(sub_dir)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    expected = sorted([dir_tree, *dir_tree.glob("**/*")])
+    with ZipFile(rpzip_out, "r") as zp:
+        names = zp.namelist()
+    assert len(names) == len(expected)
+    assert [name.rstrip("/") for name in names] == [
+        ZipInfo.from_file(path).filename.rstrip("/") for path in expected
+    ]
+
+
+def test_zip_exclude_include(base_path):
+    """-x, -i, and --exclude-from filter paths while walking directories."""
+    root = base_path / "project"
+    for path in ["a.txt", "b.pyc", "src/c.txt", "src/d.pyc", ".git/config", "build/e.txt"]:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(path)
+    ignore_file = base_path / "ignore"
+    ignore_file.write_text("# comment\n\n/build/\n*.pyc\n")
+
+    def namelist(*args):
+        rpzip_out = base_path / "rpzip.zip"
+        rpzip_args = ["-r", str(rpzip_out), str(root), *args]
+        rpzip_result = runner.invoke(app, rpzip_args)
+        assert rpzip_result.exit_code == 0, rpzip_args
+        with ZipFile(rpzip_out, "r") as zp:
+            prefix = ZipInfo.from_file(root).filename
+            return [
+                name[len(prefix) :]
+                for name in zp.namelist()
+                if name.startswith(prefix) and name != prefix
+            ]
+
+    assert namelist("-x", ".git", "--exclude", "*.pyc") == [
+        "a.txt",
+        "build/",
+        "build/e.txt",
+        "src/",
+        "src/c.txt",
+    ]
+    assert namelist("--exclude-from", str(ignore_file), "-x", ".git/", "-x", "!src/d.pyc") == [
+        "a.txt",
+        "src/",
+        "src/c.txt",
+        "src/d.pyc",
+    ]
+    assert namelist("-i", "*.txt", "-x", "build") == ["a.txt", "src/c.txt"]
+
+
+def test_zip_jobs(base_path):
+    """Recursive archive with --jobs produces the same archive as without."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_out_serial = base_path / "serial.zip"
+    rpzip_args = ["-r", str(rpzip_out_serial), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    rpzip_out_jobs = base_path / "jobs.zip"
+    rpzip_args = ["-r", "--jobs", "4", str(rpzip_out_jobs), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    assert hash_file(rpzip_out_serial) == hash_file(rpzip_out_jobs)
+
+
+def test_zip_update(base_path):
+    """--update produces the same archive as writing a new one."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_out_update = base_path / "update.zip"
+    rpzip_args = ["-r", "--update", str(rpzip_out_update), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    # Change the tree, then update the existing archive
+    next(dir_tree.glob("*.txt")).write_text("changed")
+    file_factory(dir_tree / "sub_dir")
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    rpzip_out_new = base_path / "new.zip"
+    rpzip_args = ["-r", str(rpzip_out_new), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    assert hash_file(rpzip_out_update) == hash_file(rpzip_out_new)
+
+
+def test_zip_stdout(base_path):
+    """Writing to stdout with '-' produces the same archive as --streaming to a file."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_args = ["-r", "-q", "-", str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+    stdout_bytes = rpzip_result.stdout_bytes
+
+    rpzip_out = base_path / "rpzip.zip"
+    rpzip_args = ["-r", "--streaming", str(rpzip_out), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    assert stdout_bytes == rpzip_out.read_bytes()
+
+    # Can't update stdout
+    rpzip_args = ["-r", "--update", "-", str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code != 0, rpzip_args
+
+
+def test_zip_stats(base_path):
+    """--stats reports where time was spent without changing the archive."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_out = base_path / "rpzip.zip"
+    rpzip_args = ["-r", "-q", str(rpzip_out), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    rpzip_out_stats = base_path / "rpzip_stats.zip"
+    rpzip_args = ["-r", "-q", "--stats", "--jobs", "2", str(rpzip_out_stats), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    assert hash_file(rpzip_out_stats) == hash_file(rpzip_out)
+    with ZipFile(rpzip_out, "r") as zp:
+        n_members = len(zp.infolist())
+    for line in ["walk time:", f"members: {n_members}", "compress time:", "slowest members:"]:
+        assert line in rpzip_result.output
+
+
+def test_zip_progress(base_path):
+    """--progress reports totals from walking the inputs instead of logging each file, without
+    changing the archive."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_out = base_path / "rpzip.zip"
+    rpzip_args = ["-r", str(rpzip_out), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+    assert "adding:" in rpzip_result.output
+
+    rpzip_out_progress = base_path / "rpzip_progress.zip"
+    rpzip_args = ["-r", "--progress", str(rpzip_out_progress), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+    assert "adding:" not in rpzip_result.output
+
+    assert hash_file(rpzip_out_progress) == hash_file(rpzip_out)
+    with ZipFile(rpzip_out, "r") as zp:
+        infos = zp.infolist()
+    n_files = len(infos)
+    assert f"{n_files}/{n_files} files" in rpzip_result.output
+    assert "(100.0%)" in rpzip_result.output
+    assert "ETA 0s" in rpzip_result.output
+
+
+def test_progress_throttled():
+    """Progress is reported at most once per interval, and always when finished."""
+    stream = io.StringIO()
+    progress = _Progress(3, 3000, interval=3600, stream=stream)
+    for i in range(3):
+        member = MemberStats(f"{i}.txt")
+        member.file_size = 1000
+        progress(member)
+    assert stream.getvalue() == ""
+    progress.finish()
+    assert stream.getvalue().startswith("3/3 files, 2.9 KiB/2.9 KiB (100.0%)")
+
+    stream = io.StringIO()
+    progress = _Progress(3, 3000, interval=0, stream=stream)
+    for i in range(3):
+        progress(MemberStats(f"{i}.txt"))
+    assert len(stream.getvalue().splitlines()) == 3
+
+
+def test_diff(base_path):
+    """--diff compares two archives, printing differences and exiting with status 1 if any."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_out1 = base_path / "rpzip1.zip"
+    rpzip_out2 = base_path / "rpzip2.zip"
+    for rpzip_out in [rpzip_out1, rpzip_out2]:
+        rpzip_args = ["-r", "-q", str(rpzip_out), str(dir_tree)]
+        rpzip_result = runner.invoke(app, rpzip_args)
+        assert rpzip_result.exit_code == 0, rpzip_args
+
+    rpzip_args = ["--diff", "--deep", str(rpzip_out1), str(rpzip_out2)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+    assert "no differences found" in rpzip_result.output
+
+    zip_out = base_path / "zip.zip"
+    with ZipFile(zip_out, "w") as zp:
+        for path in sorted(dir_tree.glob("**/*")):
+            zp.write(path)
+    rpzip_args = ["--diff", str(rpzip_out1), str(zip_out)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 1, rpzip_args
+    assert "date_time differs" in rpzip_result.output
+
+    rpzip_args = ["--diff", str(rpzip_out1), str(rpzip_out2), str(zip_out)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 2, rpzip_args
+
+
+def test_normalize(base_path):
+    """--normalize writes the same archive as archiving the files with rpzip."""
+    dir_tree = dir_tree_factory(base_path)
+
+    rpzip_out = base_path / "rpzip.zip"
+    rpzip_args = ["-r", "-q", str(rpzip_out), str(dir_tree)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    zip_out = base_path / "zip.zip"
+    with ZipFile(zip_out, "w") as zp:
+        for path in sorted(dir_tree.glob("**/*"), reverse=True):
+            zp.write(path)
+        zp.write(dir_tree)
+
+    rpzip_out_normalized = base_path / "normalized.zip"
+    rpzip_args = ["--normalize", str(rpzip_out_normalized), str(zip_out)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code == 0, rpzip_args
+
+    assert hash_file(rpzip_out_normalized) == hash_file(rpzip_out)
+
+    rpzip_args = ["--normalize", "--update", str(rpzip_out_normalized), str(zip_out)]
+    rpzip_result = runner.invoke(app, rpzip_args)
+    assert rpzip_result.exit_code != 0, rpzip_args
+
+
 def test_zip_no_suffix_adds_suffix(base_path):
     """Appropriately add .zip suffix if file does not have one."""
     data_file = file_factory(base_path)
@@ -1,19 +1,46 @@
+import asyncio
+import bz2
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import gc
+import gzip
+import io
+import os
+from pathlib import Path
 import platform
+import sys
 from time import sleep
-from zipfile import ZipFile, ZipInfo
+import warnings
+from zipfile import ZIP_BZIP2, ZIP_DEFLATED, ZIP_LZMA, ZIP_STORED, ZipFile, ZipInfo
+
+import pytest
 
 try:
     from time import tzset
 except ImportError:
     tzset = None  # type: ignore[assignment]
 
-from repro_zipfile import ReproducibleZipFile
+import repro_zipfile
+from repro_zipfile import (
+    ZIP_ZSTANDARD,
+    AsyncReproducibleZipFile,
+    CompressionCache,
+    CompressionPolicy,
+    ReproducibleZipFile,
+    SplitReproducibleZipFile,
+    WriteStats,
+    normalize,
+    update,
+    verify,
+)
 from tests.utils import (
+    NonSeekableBytesIO,
     assert_archive_contents_equals,
     data_factory,
     dir_tree_factory,
     file_factory,
     hash_file,
+    local_extra,
     umask,
 )
 
@@ -463,3 +490,1189 @@ def test_mkdir(rel_path):
         zp.write(dir_path)
 
     assert_archive_contents_equals(arc_repro1, arc_zip)
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+def test_write_many(base_path, compression):
+    """write_many produces the same archive as calling write on each path in turn."""
+    dir_tree = dir_tree_factory(base_path)
+    paths = sorted(dir_tree.glob("**/*"))
+
+    arc_serial = base_path / "serial.zip"
+    with ReproducibleZipFile(arc_serial, "w", compression=compression) as zp:
+        for path in paths:
+            zp.write(path)
+
+    arc_parallel = base_path / "parallel.zip"
+    with ReproducibleZipFile(arc_parallel, "w", compression=compression) as zp:
+        zp.write_many(paths, workers=4)
+
+    assert hash_file(arc_serial) == hash_file(arc_parallel)
+
+
+def test_write_many_dir_entries(base_path, monkeypatch):
+    """write_many with os.DirEntry items reuses their stat results and matches serial write."""
+    data_files = sorted(file_factory(base_path) for _ in range(3))
+    sub_dir = base_path / "sub_dir"
+    sub_dir.mkdir()
+    with os.scandir(base_path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        entry.stat()
+
+    arc_serial = base_path / "serial.zip"
+    with ReproducibleZipFile(arc_serial, "w") as zp:
+        for path in [*data_files, sub_dir]:
+            zp.write(path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Path was stat'ed again")
+
+    arc_entries = base_path / "entries.zip"
+    with ReproducibleZipFile(arc_entries, "w") as zp:
+        monkeypatch.setattr(os, "stat", fail)
+        zp.write_many(entries)
+        monkeypatch.undo()
+
+    assert hash_file(arc_serial) == hash_file(arc_entries)
+
+
+def test_write_many_arcnames_non_seekable(base_path):
+    """write_many with (path, arcname) items to a non-seekable stream matches serial write."""
+    data_files = [file_factory(base_path) for _ in range(5)]
+    items = [(path, f"renamed/{path.name}") for path in data_files]
+
+    serial = NonSeekableBytesIO()
+    with ReproducibleZipFile(serial, "w", compression=ZIP_DEFLATED) as zp:
+        for path, arcname in items:
+            zp.write(path, arcname=arcname)
+
+    parallel = NonSeekableBytesIO()
+    with ReproducibleZipFile(parallel, "w", compression=ZIP_DEFLATED) as zp:
+        zp.write_many(iter(items), workers=2)
+
+    assert serial.getvalue() == parallel.getvalue()
+    with ZipFile(io.BytesIO(parallel.getvalue()), "r") as zp:
+        assert zp.namelist() == [arcname for _, arcname in items]
+        assert zp.testzip() is None
+
+
+def test_write_many_error_closes_files(base_path):
+    """If an item fails, the files of members prepared ahead of it are closed."""
+    data_files = [file_factory(base_path) for _ in range(8)]
+    items = [base_path / "missing.txt", *data_files]
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        with ReproducibleZipFile(base_path / "arc.zip", "w") as zp:
+            with pytest.raises(FileNotFoundError):
+                zp.write_many(items, workers=2)
+        gc.collect()
+
+    assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+
+@pytest.mark.parametrize("compression", [ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+def test_compression_cache(tmp_path, monkeypatch, compression):
+    """Archives written using a CompressionCache are identical to archives written without, and
+    unchanged files are not recompressed."""
+    dir_tree = dir_tree_factory(tmp_path)
+    paths = sorted(dir_tree.glob("**/*"))
+    cache = CompressionCache(tmp_path / "cache")
+
+    arc_base = tmp_path / "base.zip"
+    with ReproducibleZipFile(arc_base, "w", compression=compression) as zp:
+        for path in paths:
+            zp.write(path)
+
+    arc_cache1 = tmp_path / "cache1.zip"
+    with ReproducibleZipFile(arc_cache1, "w", compression=compression, cache=cache) as zp:
+        for path in paths:
+            zp.write(path)
+
+    # Second time, all data should come from the cache
+    def fail(*args, **kwargs):
+        raise AssertionError("Member was compressed instead of read from cache")
+
+    monkeypatch.setattr(repro_zipfile, "_compress_member", fail)
+
+    arc_cache2 = tmp_path / "cache2.zip"
+    with ReproducibleZipFile(arc_cache2, "w", compression=compression, cache=cache) as zp:
+        zp.write_many(paths, workers=2)
+
+    assert hash_file(arc_base) == hash_file(arc_cache1)
+    assert hash_file(arc_base) == hash_file(arc_cache2)
+
+
+def test_compression_cache_eviction(tmp_path):
+    """CompressionCache evicts least recently used entries to stay within max_size."""
+    data_files = [tmp_path / f"{i}.txt" for i in range(5)]
+    for path in data_files:
+        path.write_bytes(os.urandom(1000))
+
+    cache = CompressionCache(tmp_path / "cache", max_size=2500)
+    with ReproducibleZipFile(
+        tmp_path / "archive.zip", "w", compression=ZIP_DEFLATED, cache=cache
+    ) as zp:
+        for path in data_files:
+            zp.write(path)
+
+    entries = [p for p in (tmp_path / "cache").glob("**/*") if p.is_file()]
+    assert len(entries) == 2
+    assert sum(p.stat().st_size for p in entries) <= cache.max_size
+
+    cache.clear()
+    assert not any(p.is_file() for p in (tmp_path / "cache").glob("**/*"))
+
+
+def test_compression_cache_shared(tmp_path, monkeypatch):
+    """CompressionCache leaves entries other writers are writing alone, tolerates entries evicted
+    by other writers while being read, and doesn't leave partial entries behind on errors."""
+    data_file = tmp_path / "data.txt"
+    data_file.write_bytes(os.urandom(1000))
+    cache_dir = tmp_path / "cache"
+
+    # An entry another writer is in the middle of writing
+    in_flight = cache_dir / "00" / "entry.tmp"
+    in_flight.parent.mkdir(parents=True)
+    in_flight.write_bytes(b"x" * 5000)
+
+    cache = CompressionCache(cache_dir, max_size=2500)
+    with ReproducibleZipFile(
+        tmp_path / "archive.zip", "w", compression=ZIP_DEFLATED, cache=cache
+    ) as zp:
+        zp.write(data_file, "data.txt")
+        cache.clear()
+        assert in_flight.exists()
+
+        # Entry evicted by another writer between opening it and updating its access time
+        zp.write(data_file, "first.txt")
+
+        def evicted(path, *args, **kwargs):
+            raise FileNotFoundError(path)
+
+        with monkeypatch.context() as m:
+            m.setattr(os, "utime", evicted)
+            zp.write(data_file, "second.txt")
+
+        def fail(*args, **kwargs):
+            raise OSError("No space left on device")
+
+        cache.clear()
+        with monkeypatch.context() as m:
+            m.setattr(repro_zipfile.shutil, "copyfileobj", fail)
+            with pytest.raises(OSError):
+                zp.write(data_file, "third.txt")
+    assert [p for p in cache_dir.glob("**/*") if p.is_file()] == [in_flight]
+
+    with ZipFile(tmp_path / "archive.zip", "r") as zp:
+        assert zp.read("second.txt") == data_file.read_bytes()
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_write_stats(base_path, compression):
+    """Collecting WriteStats doesn't change the archive, and records every member in order with
+    its sizes, with totals that add up."""
+    dir_tree = dir_tree_factory(base_path)
+    paths = sorted(dir_tree.glob("**/*"))
+
+    def write(name, stats=None):
+        arc_path = base_path / name
+        with ReproducibleZipFile(arc_path, "w", compression=compression, stats=stats) as zp:
+            for path in paths:
+                zp.write(path)
+            zp.write_many([(path, f"many/{path.name}") for path in paths], workers=2)
+            zp.writestr("data.txt", "hello world" * 100)
+            zp.writestr_many([("data_many.txt", "hello world" * 100)])
+            zp.write_stream("stream.txt", [b"hello world"] * 100, size_hint=1100)
+            zp.mkdir("empty_dir")
+        return arc_path
+
+    members = []
+    stats = WriteStats(on_member=members.append)
+    arc_path = write("stats.zip", stats)
+    assert hash_file(arc_path) == hash_file(write("base.zip"))
+
+    with ZipFile(arc_path, "r") as zp:
+        infos = zp.infolist()
+    assert [member.filename for member in members] == [zinfo.filename for zinfo in infos]
+    for member, zinfo in zip(members, infos):
+        assert member.file_size == zinfo.file_size
+        assert member.compress_size == zinfo.compress_size
+        assert (
+            min(member.stat_time, member.read_time, member.compress_time, member.write_time) >= 0
+        )
+    assert any(member.stat_time > 0 for member in members)
+    assert stats.members == len(infos)
+    assert stats.file_size == sum(zinfo.file_size for zinfo in infos)
+    assert stats.compress_size == sum(zinfo.compress_size for zinfo in infos)
+    assert stats.write_time == pytest.approx(sum(member.write_time for member in members))
+    assert f"members: {len(infos)}" in stats.summary()
+    assert not stats._pending
+
+
+def test_compression_policy(base_path):
+    """A CompressionPolicy chooses each member's compression from its name and content, the same
+    way for write, write_many, writestr, and write_stream, and explicit compress_type arguments
+    override it."""
+    contents = {
+        "data.txt": b"hello world\n" * 1000,
+        "photo.JPG": b"not really a jpeg\n" * 1000,
+        "sub/level.txt": b"level\n" * 1000,
+        "random.bin": os.urandom(10000),
+        "repetitive.bin": b"0" * 10000,
+    }
+    for name, data in contents.items():
+        (base_path / name).parent.mkdir(exist_ok=True)
+        (base_path / name).write_bytes(data)
+    policy = CompressionPolicy(
+        rules=[("sub/*.txt", ZIP_DEFLATED, 1), ("*.txt", ZIP_BZIP2)], sample_size=4096
+    )
+
+    def write(how):
+        arc_path = base_path / f"{how}.zip"
+        with ReproducibleZipFile(
+            arc_path, "w", compression=ZIP_LZMA, compression_policy=policy
+        ) as zp:
+            if how == "write":
+                for name in contents:
+                    zp.write(base_path / name, name)
+            elif how == "write_many":
+                zp.write_many([(base_path / name, name) for name in contents], workers=2)
+            elif how == "write_stream":
+                # Chunks smaller than the sample, which is read from several of them
+                for name, data in contents.items():
+                    chunks = [data[i : i + 1000] for i in range(0, len(data), 1000)]
+                    zp.write_stream(name, chunks, size_hint=len(data))
+            else:
+                for name, data in contents.items():
+                    zp.writestr(name, data)
+            zp.writestr("explicit.jpg", b"explicit", compress_type=ZIP_DEFLATED)
+        return arc_path
+
+    arc_path = write("write")
+    assert hash_file(write("write_many")) == hash_file(arc_path)
+    assert hash_file(write("writestr")) == hash_file(arc_path)
+    assert hash_file(write("write_stream")) == hash_file(arc_path)
+
+    with ZipFile(arc_path, "r") as zp:
+        assert zp.testzip() is None
+        assert {zinfo.filename: zinfo.compress_type for zinfo in zp.infolist()} == {
+            "data.txt": ZIP_BZIP2,
+            "photo.JPG": ZIP_STORED,
+            "sub/level.txt": ZIP_DEFLATED,
+            "random.bin": ZIP_STORED,
+            "repetitive.bin": ZIP_LZMA,
+            "explicit.jpg": ZIP_DEFLATED,
+        }
+        for name, data in contents.items():
+            assert zp.read(name) == data
+
+
+def test_compression_policy_sample_size():
+    """A sample_size too small to judge compressibility by is rejected, and NumPy .npz files,
+    which are often uncompressed, aren't stored by default."""
+    with pytest.raises(ValueError, match="sample_size"):
+        CompressionPolicy(sample_size=512)
+    assert CompressionPolicy(sample_size=1024).sample_size == 1024
+    assert CompressionPolicy().choose("arrays.npz", b"") is None
+
+
+@pytest.mark.parametrize("compression", [ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+def test_update(tmp_path, monkeypatch, compression):
+    """update produces the same archive as writing a new one, and only compresses new and
+    changed files."""
+    dir_tree = dir_tree_factory(tmp_path)
+    arc_update = tmp_path / "update.zip"
+    update(arc_update, sorted(dir_tree.glob("**/*")), compression=compression)
+
+    # Change one file, add one file, remove one file
+    changed, removed = sorted(dir_tree.glob("*.txt"))[:2]
+    changed.write_text("changed")
+    removed.unlink()
+    added = file_factory(dir_tree / "sub_dir")
+    paths = sorted(dir_tree.glob("**/*"))
+
+    compressed = []
+    orig_compress_member = repro_zipfile._compress_member
+
+    def compress_member(zinfo, *args):
+        compressed.append(zinfo.filename)
+        return orig_compress_member(zinfo, *args)
+
+    monkeypatch.setattr(repro_zipfile, "_compress_member", compress_member)
+    update(arc_update, paths, compression=compression, workers=2)
+    assert sorted(compressed) == sorted(ZipInfo.from_file(p).filename for p in [changed, added])
+
+    arc_new = tmp_path / "new.zip"
+    with ReproducibleZipFile(arc_new, "w", compression=compression) as zp:
+        for path in paths:
+            zp.write(path)
+
+    assert hash_file(arc_update) == hash_file(arc_new)
+
+
+def test_update_compresslevel(tmp_path):
+    """update can't set a compression level, since copied members keep theirs."""
+    data_file = file_factory(tmp_path)
+    with pytest.raises(ValueError, match="compresslevel"):
+        update(tmp_path / "arc.zip", [data_file], compression=ZIP_DEFLATED, compresslevel=1)
+    assert not (tmp_path / "arc.zip").exists()
+
+
+@pytest.mark.parametrize("in_memory", [False, True], ids=["file", "in_memory"])
+def test_copy_member(tmp_path, in_memory):
+    """copy_member produces the same archive as writing the member data directly, with
+    normalized metadata."""
+    data_files = [file_factory(tmp_path) for _ in range(3)]
+
+    # Source archive with non-reproducible metadata
+    src_arc = tmp_path / "src.zip"
+    with ZipFile(src_arc, "w", compression=ZIP_DEFLATED) as zp:
+        zp.mkdir("dir")
+        for path in data_files:
+            zp.write(path, arcname=f"dir/{path.name}")
+
+    arc_direct = tmp_path / "direct.zip"
+    with ReproducibleZipFile(arc_direct, "w", compression=ZIP_DEFLATED) as zp:
+        zp.write(tmp_path, arcname="copied")
+        for path in data_files:
+            zp.write(path, arcname=f"copied/{path.name}")
+
+    arc_copy = tmp_path / "copy.zip"
+    src = io.BytesIO(src_arc.read_bytes()) if in_memory else src_arc
+    with ZipFile(src, "r") as src_zp, ReproducibleZipFile(arc_copy, "w") as zp:
+        for zinfo in src_zp.infolist():
+            zp.copy_member(src_zp, zinfo, arcname=zinfo.filename.replace("dir", "copied", 1))
+
+    assert hash_file(arc_direct) == hash_file(arc_copy)
+    with ZipFile(arc_copy, "r") as zp:
+        assert zp.testzip() is None
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+@pytest.mark.parametrize("chunk_size", [7, 1000, 1024 * 1024])
+def test_write_chunk_size(tmp_path, compression, chunk_size):
+    """Writing files gives the same result regardless of chunk_size, and the same result as
+    writing their data with writestr."""
+    data_files = [file_factory(tmp_path) for _ in range(3)]
+    large_file = tmp_path / "large.bin"
+    large_file.write_bytes(os.urandom(3000) * 100)
+    data_files.append(large_file)
+
+    arc_write = tmp_path / "write.zip"
+    with ReproducibleZipFile(arc_write, "w", compression=compression, chunk_size=chunk_size) as zp:
+        for path in data_files:
+            zp.write(path)
+
+    arc_writestr = tmp_path / "writestr.zip"
+    with ReproducibleZipFile(arc_writestr, "w", compression=compression) as zp:
+        for path in data_files:
+            zp.writestr(ZipInfo.from_file(path), path.read_bytes(), compress_type=compression)
+
+    assert hash_file(arc_write) == hash_file(arc_writestr)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="Requires procfs")
+def test_write_stored_reported_empty(tmp_path):
+    """Stored files that report a size of 0 but have content, like those in /proc, are read."""
+    arc_path = tmp_path / "arc.zip"
+    with ReproducibleZipFile(arc_path, "w") as zp:
+        zp.write("/proc/self/status", "status")
+    with ZipFile(arc_path, "r") as zp:
+        assert zp.getinfo("status").file_size > 0
+        assert zp.testzip() is None
+
+
+def test_write_stored_truncated(tmp_path, monkeypatch):
+    """A stored file truncated while it's written raises an error instead of writing a member
+    whose data doesn't match its header."""
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(os.urandom(1000))
+    stored_member = repro_zipfile._stored_member
+
+    def truncate(*args):
+        result = stored_member(*args)
+        os.truncate(data_file, 10)
+        return result
+
+    monkeypatch.setattr(repro_zipfile, "_stored_member", truncate)
+    with ReproducibleZipFile(tmp_path / "arc.zip", "w") as zp:
+        with pytest.raises(EOFError):
+            zp.write(data_file)
+
+
+def test_write_stored_truncated_while_reading(tmp_path, monkeypatch):
+    """A stored file truncated while its CRC is computed raises an error, rather than crashing
+    the process as reading a memory map of it past its new end would."""
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(os.urandom(3 * 1024 * 1024))
+    crc32 = repro_zipfile.crc32
+
+    def truncate(data, value=0):
+        os.truncate(data_file, 10)
+        return crc32(data, value)
+
+    monkeypatch.setattr(repro_zipfile, "crc32", truncate)
+    with ReproducibleZipFile(tmp_path / "arc.zip", "w", chunk_size=1024 * 1024) as zp:
+        with pytest.raises(EOFError):
+            zp.write(data_file)
+
+
+def test_write_stored_wrapped_file(tmp_path):
+    """Stored data is written through file objects that wrap a file descriptor, like
+    gzip.GzipFile, rather than copied to the descriptor within the kernel."""
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(os.urandom(100000))
+
+    expected = io.BytesIO()
+    with ReproducibleZipFile(expected, "w", streaming=True) as zp:
+        zp.write(data_file, "data.bin")
+
+    gz_path = tmp_path / "arc.zip.gz"
+    with gzip.open(gz_path, "wb") as gz:
+        with ReproducibleZipFile(gz, "w", streaming=True) as zp:
+            zp.write(data_file, "data.bin")
+    with gzip.open(gz_path, "rb") as gz:
+        assert gz.read() == expected.getvalue()
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+def test_write_mmap_threshold(tmp_path, compression):
+    """Writing memory-mapped files gives the same result as reading them, with or without a
+    CompressionCache."""
+    data_files = [file_factory(tmp_path) for _ in range(3)]
+    empty_file = tmp_path / "empty.txt"
+    empty_file.touch()
+    large_file = tmp_path / "large.bin"
+    large_file.write_bytes(os.urandom(3000) * 100)
+    data_files += [empty_file, large_file]
+
+    def write(name, **kwargs):
+        arc_path = tmp_path / name
+        with ReproducibleZipFile(
+            arc_path, "w", compression=compression, chunk_size=1000, **kwargs
+        ) as zp:
+            for path in data_files:
+                zp.write(path)
+            zp.write_many([(path, f"many/{path.name}") for path in data_files], workers=2)
+        return arc_path
+
+    arc_read = write("read.zip")
+    assert hash_file(write("mmap.zip", mmap_threshold=0)) == hash_file(arc_read)
+    assert hash_file(write("large.zip", mmap_threshold=10_000)) == hash_file(arc_read)
+    cache = CompressionCache(tmp_path / "cache")
+    assert hash_file(write("cache.zip", mmap_threshold=0, cache=cache)) == hash_file(arc_read)
+
+
+def test_metadata_arguments(tmp_path):
+    """date_time, file_mode, and dir_mode arguments set the fixed values for all methods."""
+    data_file = file_factory(tmp_path)
+
+    arc_path = tmp_path / "archive.zip"
+    with ReproducibleZipFile(
+        arc_path, "w", date_time=(2024, 1, 1, 0, 0, 0), file_mode=0o600, dir_mode=0o700
+    ) as zp:
+        zp.write(data_file, arcname="write.txt")
+        zp.write(tmp_path, arcname="write_dir")
+        zp.writestr("writestr.txt", data="data")
+        zp.writestr("writestr_dir/", data="")
+        zp.mkdir("mkdir")
+
+    with ZipFile(arc_path, "r") as zp:
+        for zinfo in zp.infolist():
+            assert zinfo.date_time == (2024, 1, 1, 0, 0, 0), zinfo
+            mode = (zinfo.external_attr >> 16) & 0o777
+            assert mode == (0o700 if zinfo.is_dir() else 0o600), (zinfo, oct(mode))
+
+
+def test_metadata_env_vars_read_once(tmp_path, monkeypatch):
+    """Environment variables are read when the archive is opened, so changing them while writing
+    does not affect the archive."""
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1691732367")
+    monkeypatch.setenv("REPRO_ZIPFILE_DIR_MODE", "700")
+
+    arc_path = tmp_path / "archive.zip"
+    with ReproducibleZipFile(arc_path, "w") as zp:
+        zp.writestr("before.txt", data="data")
+        monkeypatch.setenv("SOURCE_DATE_EPOCH", "1704067230")
+        monkeypatch.setenv("REPRO_ZIPFILE_FILE_MODE", "600")
+        zp.writestr("after.txt", data="data")
+        zp.mkdir("dir")
+
+    with ZipFile(arc_path, "r") as zp:
+        infos = zp.infolist()
+    assert len({zinfo.date_time for zinfo in infos}) == 1
+    assert (zp.getinfo("after.txt").external_attr >> 16) & 0o777 == 0o644
+    assert (zp.getinfo("dir/").external_attr >> 16) & 0o777 == 0o700
+
+
+@pytest.mark.parametrize(
+    "env_var", ["SOURCE_DATE_EPOCH", "REPRO_ZIPFILE_FILE_MODE", "REPRO_ZIPFILE_DIR_MODE"]
+)
+def test_metadata_env_vars_not_read_for_reading(tmp_path, monkeypatch, env_var):
+    """Invalid environment variables don't prevent reading archives, which doesn't use them."""
+    arc_path = tmp_path / "archive.zip"
+    with ReproducibleZipFile(arc_path, "w") as zp:
+        zp.writestr("data.txt", data="data")
+
+    monkeypatch.setenv(env_var, "abc")
+    with ReproducibleZipFile(arc_path) as zp:
+        assert zp.namelist() == ["data.txt"]
+    with pytest.raises(ValueError):
+        ReproducibleZipFile(tmp_path / "other.zip", "w")
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+@pytest.mark.parametrize("seekable", [True, False], ids=["seekable", "non_seekable"])
+def test_writestr_many(compression, seekable):
+    """writestr_many produces the same archive as calling writestr for each item."""
+    items = [(f"{i:03d}.txt", data_factory() * i) for i in range(50)]
+    items.append(("dir/", b""))
+    items.append((ZipInfo("zinfo.txt", date_time=(2000, 1, 1, 0, 0, 0)), b"bytes"))
+    items.append(("buffer.bin", memoryview(b"buffer")))
+    # Larger than the amount of data that is joined before being written
+    items.append(("large.bin", b"large" * 300000))
+    items.append(("after_large.txt", b"after"))
+
+    stream_cls = io.BytesIO if seekable else NonSeekableBytesIO
+
+    serial = stream_cls()
+    with ReproducibleZipFile(serial, "w", compression=compression) as zp:
+        for zinfo_or_arcname, data in items:
+            zp.writestr(zinfo_or_arcname, data)
+
+    batched = stream_cls()
+    with ReproducibleZipFile(batched, "w", compression=compression) as zp:
+        zp.writestr_many(iter(items))
+
+    assert serial.getvalue() == batched.getvalue()
+    with ZipFile(io.BytesIO(batched.getvalue()), "r") as zp:
+        assert zp.testzip() is None
+
+
+def test_writestr_many_error():
+    """Members before an error in writestr_many are written, and the archive is valid."""
+
+    def items():
+        yield "first.txt", b"first"
+        yield "second.txt", b"second"
+        raise RuntimeError("Failed to get data")
+
+    arc = io.BytesIO()
+    with ReproducibleZipFile(arc, "w") as zp:
+        with pytest.raises(RuntimeError):
+            zp.writestr_many(items())
+        zp.writestr("after.txt", b"after")
+
+    with ZipFile(arc, "r") as zp:
+        assert zp.testzip() is None
+        assert zp.namelist() == ["first.txt", "second.txt", "after.txt"]
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_write_stream(compression):
+    """write_stream with a size hint produces the same archive as writestr, and without one
+    produces a valid, reproducible archive."""
+    chunks = [data_factory().encode() * 1000 for _ in range(10)]
+    data = b"".join(chunks)
+
+    arc_writestr = io.BytesIO()
+    with ReproducibleZipFile(arc_writestr, "w", compression=compression) as zp:
+        zp.writestr("data.txt", data)
+
+    arc_iterable = io.BytesIO()
+    with ReproducibleZipFile(arc_iterable, "w", compression=compression) as zp:
+        zp.write_stream("data.txt", iter(chunks), size_hint=len(data))
+
+    arc_fileobj = io.BytesIO()
+    with ReproducibleZipFile(arc_fileobj, "w", compression=compression, chunk_size=1000) as zp:
+        zp.write_stream("data.txt", io.BytesIO(data), size_hint=len(data))
+
+    assert arc_iterable.getvalue() == arc_writestr.getvalue()
+    assert arc_fileobj.getvalue() == arc_writestr.getvalue()
+
+    # Without size hint
+    unsized = []
+    for _ in range(2):
+        arc_unsized = io.BytesIO()
+        with ReproducibleZipFile(arc_unsized, "w", compression=compression) as zp:
+            zp.write_stream("data.txt", (chunk for chunk in chunks))
+        unsized.append(arc_unsized.getvalue())
+        with ZipFile(arc_unsized, "r") as zp:
+            assert zp.read("data.txt") == data
+
+    assert unsized[0] == unsized[1]
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+def test_streaming(base_path, compression):
+    """With streaming=True, the archive is the same whether written to a regular file, a
+    seekable stream, or a non-seekable stream, and always uses data descriptors."""
+    data_file = file_factory(base_path)
+
+    def write(file, **kwargs):
+        with ReproducibleZipFile(file, "w", compression=compression, **kwargs) as zp:
+            zp.write(data_file, arcname="write.txt")
+            zp.write_many([(data_file, "write_many.txt")])
+            zp.writestr("writestr.txt", "data" * 100)
+            zp.writestr_many([("writestr_many.txt", "data" * 100)])
+            zp.write_stream("write_stream.txt", [b"data"] * 100)
+            zp.mkdir("dir")
+
+    arc_file = base_path / "streaming.zip"
+    write(arc_file, streaming=True)
+    seekable = io.BytesIO()
+    write(seekable, streaming=True)
+    non_seekable = NonSeekableBytesIO()
+    write(non_seekable, streaming=True)
+    non_seekable_default = NonSeekableBytesIO()
+    write(non_seekable_default)
+
+    assert arc_file.read_bytes() == seekable.getvalue()
+    assert seekable.getvalue() == non_seekable.getvalue()
+    assert seekable.getvalue() == non_seekable_default.getvalue()
+
+    with ZipFile(arc_file, "r") as zp:
+        assert zp.testzip() is None
+        for zinfo in zp.infolist():
+            if not zinfo.is_dir():
+                assert zinfo.flag_bits & 0x08
+
+
+@pytest.mark.parametrize("opener", [gzip.open, bz2.open], ids=["gzip", "bz2"])
+def test_streaming_wrapped_file(tmp_path, opener):
+    """Archives streamed into a file object that transforms data, like a compressed file, hold
+    the same data as archives streamed into memory."""
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(os.urandom(100000))
+
+    def write(file):
+        with ReproducibleZipFile(file, "w", streaming=True) as zp:
+            zp.write(data_file, arcname="write.txt")
+            zp.write_many([(data_file, "write_many.txt")])
+
+    expected = io.BytesIO()
+    write(expected)
+    wrapped_path = tmp_path / "streaming.zip.compressed"
+    with opener(wrapped_path, "wb") as wrapped:
+        write(wrapped)
+    with opener(wrapped_path, "rb") as wrapped:
+        assert wrapped.read() == expected.getvalue()
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_async_zipfile(base_path, compression):
+    """AsyncReproducibleZipFile produces the same archive as making the same calls on
+    ReproducibleZipFile, whether calls are awaited in turn or run concurrently."""
+    dir_tree = dir_tree_factory(base_path)
+    paths = sorted(dir_tree.glob("**/*"))
+    items = [(f"{i:03d}.txt", data_factory() * i) for i in range(20)]
+
+    arc_sync = base_path / "sync.zip"
+    with ReproducibleZipFile(arc_sync, "w", compression=compression) as zp:
+        zp.write(paths[0], arcname="first.txt")
+        zp.mkdir("empty")
+        for path in paths:
+            zp.write(path)
+        for arcname, data in items:
+            zp.writestr(arcname, data)
+
+    async def paths_async():
+        for path in paths:
+            yield path
+
+    async def write_sequential(arc):
+        async with AsyncReproducibleZipFile(arc, "w", compression=compression) as zp:
+            await zp.write(paths[0], arcname="first.txt")
+            await zp.mkdir("empty")
+            await zp.write_many(paths_async())
+            await zp.writestr_many(items)
+
+    async def write_concurrent(arc):
+        async with AsyncReproducibleZipFile(
+            arc, "w", compression=compression, max_pending=3
+        ) as zp:
+            await asyncio.gather(
+                zp.write(paths[0], arcname="first.txt"),
+                zp.mkdir("empty"),
+                *(zp.write(path) for path in paths),
+                *(zp.writestr(arcname, data) for arcname, data in items),
+            )
+
+    arc_sequential = base_path / "sequential.zip"
+    asyncio.run(write_sequential(arc_sequential))
+    assert hash_file(arc_sequential) == hash_file(arc_sync)
+
+    arc_concurrent = base_path / "concurrent.zip"
+    asyncio.run(write_concurrent(arc_concurrent))
+    assert hash_file(arc_concurrent) == hash_file(arc_sync)
+
+
+def test_async_zipfile_error(base_path):
+    """A failed call raises its error without affecting the other members."""
+    data_file = file_factory(base_path)
+
+    arc_sync = base_path / "sync.zip"
+    with ReproducibleZipFile(arc_sync, "w") as zp:
+        zp.write(data_file)
+        zp.writestr("after.txt", "after")
+
+    async def write(arc):
+        async with AsyncReproducibleZipFile(arc, "w") as zp:
+            results = await asyncio.gather(
+                zp.write(data_file),
+                zp.write(base_path / "missing.txt"),
+                zp.writestr("after.txt", "after"),
+                return_exceptions=True,
+            )
+        return results
+
+    arc_async = base_path / "async.zip"
+    results = asyncio.run(write(arc_async))
+    assert results[0] is None
+    assert isinstance(results[1], FileNotFoundError)
+    assert results[2] is None
+    assert hash_file(arc_async) == hash_file(arc_sync)
+
+
+def test_async_zipfile_cancel(tmp_path, monkeypatch):
+    """A call cancelled while waiting for earlier calls doesn't let later calls append members
+    before the earlier calls have."""
+    compress_bytes = ReproducibleZipFile._compress_bytes
+
+    def slow_compress_bytes(self, zinfo, data):
+        if zinfo.filename == "a.txt":
+            sleep(0.5)
+        return compress_bytes(self, zinfo, data)
+
+    monkeypatch.setattr(ReproducibleZipFile, "_compress_bytes", slow_compress_bytes)
+
+    async def write(arc):
+        async with AsyncReproducibleZipFile(arc, "w", max_pending=10) as zp:
+            calls = [asyncio.ensure_future(zp.writestr(f"{name}.txt", name)) for name in "abc"]
+            await asyncio.sleep(0.1)
+            calls[1].cancel()
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+    arc_path = tmp_path / "async.zip"
+    results = asyncio.run(write(arc_path))
+    assert isinstance(results[1], asyncio.CancelledError)
+    with ZipFile(arc_path, "r") as zp:
+        assert zp.namelist() == ["a.txt", "c.txt"]
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_split(base_path, compression):
+    """SplitReproducibleZipFile writes self-contained parts no larger than max_size that together
+    hold all members in order, and the same parts each time."""
+    data_files = [file_factory(base_path) for _ in range(3)]
+    items = [(f"{i:03d}.txt", os.urandom(20 * i)) for i in range(40)]
+    max_size = 2000
+
+    def write(name, many):
+        closed = []
+        with SplitReproducibleZipFile(
+            str(base_path / f"{name}-{{:02d}}.zip"),
+            max_size,
+            compression,
+            on_part=closed.append,
+        ) as zp:
+            zp.mkdir("dir")
+            if many:
+                zp.write_many([(path, f"dir/{path.name}") for path in data_files], workers=2)
+            else:
+                for path in data_files:
+                    zp.write(path, arcname=f"dir/{path.name}")
+            for arcname, data in items:
+                zp.writestr(arcname, data)
+        assert closed == zp.parts
+        return [Path(part) for part in zp.parts]
+
+    parts = write("serial", many=False)
+    assert len(parts) > 1
+    names = []
+    for part in parts:
+        assert part.stat().st_size <= max_size
+        with ZipFile(part, "r") as zp:
+            assert zp.testzip() is None
+            names.extend(zp.namelist())
+    assert names == [
+        "dir/",
+        *(f"dir/{path.name}" for path in data_files),
+        *(arcname for arcname, _ in items),
+    ]
+
+    parts_many = write("many", many=True)
+    assert [hash_file(part) for part in parts] == [hash_file(part) for part in parts_many]
+
+
+def test_split_member_too_large(base_path):
+    """A member larger than max_size can't be written."""
+    with SplitReproducibleZipFile(str(base_path / "part-{}.zip"), 1000) as zp:
+        with pytest.raises(ValueError, match="does not fit"):
+            zp.writestr("large.txt", b"0" * 1000)
+
+
+def test_split_write_many_error_closes_files(base_path):
+    """If an item of write_many fails, the files of members prepared ahead of it are closed."""
+    large_file = base_path / "large.bin"
+    large_file.write_bytes(os.urandom(2000))
+    data_files = [file_factory(base_path) for _ in range(8)]
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        with pytest.raises(ValueError, match="does not fit"):
+            with SplitReproducibleZipFile(str(base_path / "part-{}.zip"), 1000) as zp:
+                zp.write_many([large_file, *data_files], workers=2)
+        gc.collect()
+
+    assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+
+requires_zstd = pytest.mark.skipif(
+    repro_zipfile._zstd is None, reason="Requires Python 3.14 or backports.zstd"
+)
+
+
+def zstd_zipfile():
+    """ZipFile class that can read Zstandard-compressed members."""
+    if sys.version_info >= (3, 14):
+        return ZipFile
+    from backports.zstd.zipfile import ZipFile as BackportsZipFile
+
+    return BackportsZipFile
+
+
+@requires_zstd
+def test_zstandard(base_path):
+    """Zstandard-compressed archives are identical whichever way members are written, and can be
+    read back."""
+    data_file = file_factory(base_path)
+    empty_file = base_path / "empty.txt"
+    empty_file.touch()
+    cache = CompressionCache(base_path / "cache")
+
+    def write(how):
+        arc_path = base_path / f"{how}.zip"
+        with ReproducibleZipFile(
+            arc_path, "w", compression=ZIP_ZSTANDARD, cache=cache if how == "cache" else None
+        ) as zp:
+            zp.mkdir("dir")
+            for path in [data_file, empty_file]:
+                if how in ("write", "cache"):
+                    zp.write(path, path.name)
+                elif how == "write_many":
+                    zp.write_many([(path, path.name)])
+                elif how == "writestr":
+                    zp.writestr(path.name, path.read_bytes())
+                else:
+                    with path.open("rb") as f:
+                        zp.write_stream(path.name, f, size_hint=path.stat().st_size)
+        return arc_path
+
+    arc_path = write("write")
+    for how in ["write_many", "writestr", "write_stream", "cache"]:
+        assert hash_file(write(how)) == hash_file(arc_path)
+
+    with zstd_zipfile()(arc_path, "r") as zp:
+        assert zp.testzip() is None
+        assert zp.read(data_file.name) == data_file.read_bytes()
+        assert zp.read(empty_file.name) == b""
+        for zinfo in zp.infolist():
+            if not zinfo.is_dir():
+                assert zinfo.compress_type == ZIP_ZSTANDARD
+                assert zinfo.extract_version >= 63
+
+
+@requires_zstd
+def test_zstandard_write_stream_zip64(tmp_path):
+    """Zstandard members streamed without a size hint are written with ZIP64 extensions, like
+    members with other compression methods."""
+    arc_path = tmp_path / "arc.zip"
+    with ReproducibleZipFile(arc_path, "w", compression=ZIP_ZSTANDARD) as zp:
+        zp.write_stream("unhinted.txt", [b"data"] * 100)
+        zp.write_stream("hinted.txt", [b"data"] * 100, size_hint=400)
+
+    assert len(local_extra(arc_path, "unhinted.txt")) == 20
+    assert local_extra(arc_path, "hinted.txt") == b""
+    with zstd_zipfile()(arc_path, "r") as zp:
+        assert zp.read("unhinted.txt") == b"data" * 100
+
+
+@requires_zstd
+def test_zstandard_workers():
+    """Multithreaded Zstandard compression is deterministic regardless of the number of
+    threads."""
+    data = os.urandom(1000) * 5000
+
+    def write(zstd_workers):
+        buffer = io.BytesIO()
+        with ReproducibleZipFile(
+            buffer, "w", compression=ZIP_ZSTANDARD, zstd_workers=zstd_workers
+        ) as zp:
+            zp.writestr("data.bin", data)
+        return buffer.getvalue()
+
+    assert write(1) == write(4)
+    with zstd_zipfile()(io.BytesIO(write(4)), "r") as zp:
+        assert zp.read("data.bin") == data
+
+
+def test_normalize(tmp_path):
+    """normalize makes archives written in any order with any metadata identical to writing the
+    files with ReproducibleZipFile, without recompressing."""
+    dir_tree = dir_tree_factory(tmp_path)
+    paths = sorted(dir_tree.glob("**/*"))
+
+    arc_repro = tmp_path / "repro.zip"
+    with ReproducibleZipFile(arc_repro, "w", compression=ZIP_DEFLATED) as zp:
+        for path in paths:
+            zp.write(path)
+
+    # Archives written in reverse order, with extended timestamp extra fields and a comment
+    arc_vendor = tmp_path / "vendor.zip"
+    with ZipFile(arc_vendor, "w", compression=ZIP_DEFLATED) as zp:
+        zp.comment = b"vendor"
+        for path in reversed(paths):
+            zinfo = ZipInfo.from_file(path)
+            zinfo.extra = b"UT\x05\x00\x01\x00\x00\x00\x00"
+            data = b"" if zinfo.is_dir() else path.read_bytes()
+            zp.writestr(zinfo, data, compress_type=ZIP_DEFLATED)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Member was recompressed")
+
+    arc_normalized = tmp_path / "normalized.zip"
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(repro_zipfile, "_compress_member", fail)
+        monkeypatch.setattr(repro_zipfile, "_compress_data", fail)
+        normalize(arc_vendor, arc_normalized)
+
+    assert verify(arc_repro, arc_normalized) == []
+    assert hash_file(arc_normalized) == hash_file(arc_repro)
+
+    # Without sorting, the order of the source is kept
+    arc_unsorted = tmp_path / "unsorted.zip"
+    normalize(arc_vendor, arc_unsorted, sort=False)
+    with ZipFile(arc_repro, "r") as zp:
+        names = zp.namelist()
+    with ZipFile(arc_unsorted, "r") as zp:
+        assert zp.namelist() == names[::-1]
+
+
+def test_verify(tmp_path):
+    """verify finds differences in metadata, members, order, and content without extracting."""
+    data_file = file_factory(tmp_path)
+    other_file = file_factory(tmp_path)
+
+    def write(name, paths, zipfile_cls=ReproducibleZipFile):
+        arc_path = tmp_path / name
+        with zipfile_cls(arc_path, "w") as zp:
+            for path in paths:
+                zp.write(path, path.name)
+        return arc_path
+
+    arc1 = write("arc1.zip", [data_file, other_file])
+    sleep(2)
+    data_file.touch()
+    assert verify(arc1, write("arc2.zip", [data_file, other_file])) == []
+
+    # Archive written by ZipFile differs in timestamp, and maybe permissions and extra fields
+    differences = verify(arc1, write("zipfile.zip", [data_file, other_file], ZipFile))
+    assert "date_time" in {d.field for d in differences if d.name == data_file.name}
+    assert verify(arc1, tmp_path / "zipfile.zip", ignore={d.field for d in differences}) == []
+
+    differences = verify(arc1, write("reordered.zip", [other_file, data_file]))
+    assert [d.field for d in differences] == ["order"]
+    differences = verify(arc1, write("missing.zip", [data_file]))
+    assert differences == [(other_file.name, "member", True, False)]
+    assert str(differences[0]) == f"{other_file.name}: member differs: True != False"
+
+    with ReproducibleZipFile(tmp_path / "changed.zip", "w") as zp:
+        zp.writestr(data_file.name, b"changed")
+        zp.write(other_file, other_file.name)
+    differences = verify(arc1, tmp_path / "changed.zip")
+    assert {d.field for d in differences} == {"CRC", "compress_size", "file_size"}
+    assert {d.name for d in differences} == {data_file.name}
+
+    # Change a byte of stored data, leaving the central directory as is
+    corrupted = tmp_path / "corrupted.zip"
+    data = bytearray(arc1.read_bytes())
+    with ZipFile(arc1, "r") as zp:
+        zinfo = zp.getinfo(data_file.name)
+        offset = zinfo.header_offset + len(zinfo.FileHeader()) + 1
+    data[offset] ^= 0xFF
+    corrupted.write_bytes(data)
+    assert verify(arc1, corrupted) == []
+    assert verify(arc1, corrupted, deep=True) == [(data_file.name, "data", None, None)]
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_sort(tmp_path, compression):
+    """Members added in any order from several threads are written sorted by name, and the
+    archive is identical to adding them in sorted order."""
+    dir_tree = dir_tree_factory(tmp_path)
+    paths = sorted(dir_tree.glob("**/*"))
+    streamed = b"streamed data" * 1000
+
+    arc_sorted = tmp_path / "sorted.zip"
+    with ReproducibleZipFile(arc_sorted, "w", compression=compression) as zp:
+        zp.mkdir("aaa")
+        zp.writestr("aab.txt", streamed)
+        for path in paths:
+            zp.write(path)
+        zp.writestr("zzz.txt", "text")
+
+    def add(zp, item):
+        if item == "aab.txt":
+            zp.write_stream(item, io.BytesIO(streamed), size_hint=len(streamed))
+        elif item == "zzz.txt":
+            zp.writestr(item, "text")
+        elif item == "aaa":
+            zp.mkdir(item)
+        else:
+            zp.write(item)
+
+    items = ["zzz.txt", "aaa", "aab.txt", *reversed(paths)]
+    arc_concurrent = tmp_path / "concurrent.zip"
+    with ReproducibleZipFile(arc_concurrent, "w", compression=compression, sort=True) as zp:
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(partial(add, zp), items))
+        with pytest.raises(ValueError):
+            zp.open("open.txt", "w")
+
+    assert verify(arc_sorted, arc_concurrent) == []
+    assert hash_file(arc_concurrent) == hash_file(arc_sorted)
+
+    # Sorted by a key function of the name instead
+    arc_reversed = tmp_path / "reversed.zip"
+    with ReproducibleZipFile(
+        arc_reversed, "w", compression=compression, sort=True, sort_key=len
+    ) as zp:
+        for item in items:
+            add(zp, item)
+    with ZipFile(arc_reversed, "r") as zp:
+        names = zp.namelist()
+    assert names == sorted(names, key=lambda name: (len(name), name))
+    assert_archive_contents_equals(arc_sorted, arc_reversed)
+
+    with pytest.raises(ValueError):
+        SplitReproducibleZipFile(str(tmp_path / "part-{}.zip"), 4096, sort=True)
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_sort_write_stream(tmp_path, compression):
+    """Members streamed without a size hint are written with ZIP64 extensions when sorted too."""
+    arc_unsorted = tmp_path / "unsorted.zip"
+    with ReproducibleZipFile(arc_unsorted, "w", compression=compression) as zp:
+        zp.write_stream("a.txt", [b"data"] * 100)
+        zp.write_stream("b.txt", [b"data"] * 100, size_hint=400)
+
+    arc_sorted = tmp_path / "sorted.zip"
+    with ReproducibleZipFile(arc_sorted, "w", compression=compression, sort=True) as zp:
+        zp.write_stream("b.txt", [b"data"] * 100, size_hint=400)
+        zp.write_stream("a.txt", [b"data"] * 100)
+
+    assert len(local_extra(arc_sorted, "a.txt")) == 20
+    assert local_extra(arc_sorted, "b.txt") == b""
+    assert hash_file(arc_sorted) == hash_file(arc_unsorted)
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+def test_sort_init_error(tmp_path, monkeypatch):
+    """An archive that fails to open is cleaned up without further errors."""
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "abc")
+    with pytest.raises(ValueError):
+        ReproducibleZipFile(tmp_path / "arc.zip", "w", sort=True)
+    gc.collect()
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA])
+def test_concurrent(tmp_path, compression):
+    """write and writestr can be called from several threads at once, and compress members
+    outside the lock, with the same result as writing them one at a time."""
+    dir_tree = dir_tree_factory(tmp_path)
+    paths = sorted(dir_tree.glob("**/*"))
+    items = sorted(
+        [*paths, *(f"data/{i:02d}.txt" for i in range(20))],
+        key=lambda item: item if isinstance(item, str) else ZipInfo.from_file(item).filename,
+    )
+
+    def add(zp, item):
+        if isinstance(item, str):
+            zp.writestr(item, item * 1000)
+        else:
+            zp.write(item)
+
+    arc_sequential = tmp_path / "sequential.zip"
+    with ReproducibleZipFile(arc_sequential, "w", compression=compression) as zp:
+        for item in items:
+            add(zp, item)
+
+    # Compression doesn't use zipfile's write handles, which can only be open one at a time
+    arc_concurrent = tmp_path / "concurrent.zip"
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(ZipFile, "_open_to_write", None)
+        with ReproducibleZipFile(
+            arc_concurrent, "w", compression=compression, concurrent=True
+        ) as zp:
+            with ThreadPoolExecutor(4) as executor:
+                list(executor.map(partial(add, zp), items))
+
+    assert_archive_contents_equals(arc_sequential, arc_concurrent)
+    with ZipFile(arc_concurrent, "r") as zp:
+        assert zp.testzip() is None
+    differences = verify(arc_sequential, arc_concurrent)
+    assert {d.field for d in differences} <= {"order"}
+
+    # Sorted, the archive is identical
+    arc_sorted = tmp_path / "sorted.zip"
+    with ReproducibleZipFile(
+        arc_sorted, "w", compression=compression, concurrent=True, sort=True
+    ) as zp:
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(partial(add, zp), reversed(items)))
+    assert hash_file(arc_sorted) == hash_file(arc_sequential)
+
+
+@pytest.mark.parametrize("compression", [ZIP_STORED, ZIP_DEFLATED])
+def test_write_known_stat(tmp_path, compression):
+    """write reuses a stat result or size the caller already has, or the stat result of an
+    os.DirEntry, instead of getting it from the filesystem, with the same result."""
+    dir_tree = dir_tree_factory(tmp_path)
+    paths = sorted(dir_tree.glob("**/*"))
+
+    arc_expected = tmp_path / "expected.zip"
+    with ReproducibleZipFile(arc_expected, "w", compression=compression) as zp:
+        for path in paths:
+            zp.write(path, path.relative_to(tmp_path))
+
+    stat_results = {path: path.stat() for path in paths}
+    entries = {}
+    for root, _, _ in os.walk(tmp_path):
+        for entry in os.scandir(root):
+            entries[Path(entry.path)] = entry
+
+    def fail(*args, **kwargs):
+        raise AssertionError("File was stat-ed")
+
+    arcs = [tmp_path / f"{name}.zip" for name in ("stat_result", "file_size", "dir_entry")]
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(ZipInfo, "from_file", fail)
+        with ReproducibleZipFile(arcs[0], "w", compression=compression) as zp:
+            for path in paths:
+                zp.write(path, path.relative_to(tmp_path), stat_result=stat_results[path])
+        with ReproducibleZipFile(arcs[1], "w", compression=compression) as zp:
+            for path in paths:
+                if path.is_dir():
+                    zp.mkdir(path.relative_to(tmp_path).as_posix())
+                else:
+                    file_size = stat_results[path].st_size
+                    zp.write(path, path.relative_to(tmp_path), file_size=file_size)
+        with ReproducibleZipFile(arcs[2], "w", compression=compression) as zp:
+            for path in paths:
+                zp.write(entries[path], path.relative_to(tmp_path))
+
+    for arc in arcs:
+        assert hash_file(arc) == hash_file(arc_expected)
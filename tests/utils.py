@@ -1,8 +1,10 @@
 from contextlib import contextmanager
 import hashlib
+import io
 import os
 from pathlib import Path
 import re
+import struct
 from tempfile import TemporaryDirectory
 from typing import Iterator
 from zipfile import ZipFile
@@ -55,11 +57,36 @@ def umask(mask: int) -> Iterator[int]:
     os.umask(old_mask)
 
 
+class NonSeekableBytesIO(io.BytesIO):
+    """Utility in-memory stream that behaves like a pipe or socket, i.e., cannot seek or tell."""
+
+    def seekable(self) -> bool:
+        return False
+
+    def seek(self, *args, **kwargs) -> int:
+        raise io.UnsupportedOperation("seek")
+
+    def tell(self) -> int:
+        raise io.UnsupportedOperation("tell")
+
+
 def hash_file(path: Path) -> str:
     """Utility function to calculate the hash of a file's contents."""
     return hashlib.md5(path.read_bytes()).hexdigest()
 
 
+def local_extra(arc: Path, name: str) -> bytes:
+    """Utility function to read the extra field of a member's local header in an archive."""
+    with ZipFile(arc, "r") as zp:
+        zinfo = zp.getinfo(name)
+    with arc.open("rb") as fp:
+        fp.seek(zinfo.header_offset)
+        header = fp.read(30)
+        filename_length, extra_length = struct.unpack("<HH", header[26:30])
+        fp.seek(filename_length, os.SEEK_CUR)
+        return fp.read(extra_length)
+
+
 def assert_archive_contents_equals(arc1: Path, arc2: Path) -> None:
     with TemporaryDirectory() as outdir1, TemporaryDirectory() as outdir2:
         with ZipFile(arc1, "r") as zp: